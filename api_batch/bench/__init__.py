@@ -0,0 +1,2 @@
+__all__ = ["MockMiniMaxServer"]
+from .mock_server import MockMiniMaxServer
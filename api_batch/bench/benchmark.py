@@ -0,0 +1,155 @@
+"""
+批量引擎的吞吐基准测试
+
+在本地模拟接口上按不同的并发配置运行 process_batch / process_batch_async，
+报告 任务数/分钟、每个任务的接口调用次数 和 峰值内存(RSS)。
+每个配置在独立的子进程中运行(独立的数据库和输出目录)，峰值内存互不影响。
+
+在 api_batch 目录下运行:
+    python -m bench.benchmark --tasks 200 --latency 2 4 --max_workers 1 3 8 --engine sync async
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bench.mock_server import MockMiniMaxServer
+
+BENCH_MODEL = 'T2V-01'
+
+
+def peak_rss_mb():
+    """当前进程的峰值RSS(MB)，Linux上 ru_maxrss 单位为KB，macOS上为字节"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_child(args):
+    """子进程：对模拟接口跑一轮批量生成，结果以JSON输出到标准输出最后一行"""
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(args.workdir, 'bench.db')}"
+    from hailuo import MiniMaxVideoBatchGenerator
+    from orm.base import session_scope
+    from orm.video_task import VideoTask
+
+    rate_limits = {'submit': (args.submit_rate, max(1, int(args.submit_rate))),
+                   'query': (args.query_rate, max(1, int(args.query_rate))),
+                   'retrieve': (args.query_rate, max(1, int(args.query_rate)))}
+    generator = MiniMaxVideoBatchGenerator('bench-key', base_url=args.base_url, rate_limits=rate_limits,
+                                           preflight=False, dedup=False)
+
+    # 写入少量历史记录，让轮询调度按模拟接口的生成耗时安排首次查询
+    now = datetime.now()
+    with session_scope() as db:
+        for i in range(5):
+            db.add(VideoTask(task_id=f"history-{i}", model=BENCH_MODEL, status='Completed',
+                             submit_time=now - timedelta(seconds=args.expected_latency), complete_time=now))
+
+    tasks = ({'model': BENCH_MODEL, 'prompt': f"benchmark task {i}"} for i in range(args.tasks))
+    output_dir = os.path.join(args.workdir, 'output')
+    started = time.perf_counter()
+    run = generator.process_batch_async if args.engine == 'async' else generator.process_batch
+    task_info = run(tasks, output_dir=output_dir, max_workers=args.max_workers,
+                    check_interval=args.check_interval, max_check_interval=args.max_check_interval,
+                    download_workers=args.download_workers, max_in_flight=args.max_in_flight or None,
+                    cache_policy='never')
+    elapsed = time.perf_counter() - started
+    generator.close()
+
+    completed = sum(1 for task in task_info if task.get('status') == 'Completed')
+    api_calls = sum(generator.metrics.api_calls.snapshot().values())
+    print(json.dumps({
+        'engine': args.engine,
+        'max_workers': args.max_workers,
+        'tasks': args.tasks,
+        'completed': completed,
+        'elapsed': elapsed,
+        'tasks_per_min': completed / elapsed * 60,
+        'api_calls': api_calls,
+        'calls_per_task': api_calls / max(len(task_info), 1),
+        'peak_rss_mb': peak_rss_mb(),
+    }))
+
+
+def run_benchmark(args):
+    server = MockMiniMaxServer(latency=tuple(args.latency), fail_rate=args.fail_rate,
+                               submit_rate=args.server_submit_rate, download_size=args.download_size,
+                               seed=args.seed).start()
+    results = []
+    try:
+        for engine in args.engine:
+            for max_workers in args.max_workers:
+                server.reset()
+                with tempfile.TemporaryDirectory(prefix='hailuo-bench-') as workdir:
+                    command = [sys.executable, '-m', 'bench.benchmark', '--child',
+                               '--base_url', server.base_url, '--workdir', workdir,
+                               '--engine', engine, '--max_workers', str(max_workers),
+                               '--tasks', str(args.tasks),
+                               '--expected_latency', str(sum(args.latency) / 2),
+                               '--check_interval', str(args.check_interval),
+                               '--max_check_interval', str(args.max_check_interval),
+                               '--download_workers', str(args.download_workers),
+                               '--max_in_flight', str(args.max_in_flight),
+                               '--submit_rate', str(args.submit_rate),
+                               '--query_rate', str(args.query_rate)]
+                    completed = subprocess.run(command, capture_output=True, text=True,
+                                               cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+                    if completed.returncode != 0:
+                        print(completed.stdout[-2000:], completed.stderr[-2000:])
+                        raise RuntimeError(f"基准测试子进程失败: engine={engine} max_workers={max_workers}")
+                    result = json.loads(completed.stdout.strip().splitlines()[-1])
+                    result['server_calls'] = dict(server.calls)
+                    results.append(result)
+                    print(f"{engine:>5} max_workers={max_workers:<3} "
+                          f"{result['tasks_per_min']:8.1f} 任务/分钟  "
+                          f"{result['calls_per_task']:5.2f} 次调用/任务  "
+                          f"峰值内存 {result['peak_rss_mb']:.1f} MB  "
+                          f"完成 {result['completed']}/{result['tasks']}")
+    finally:
+        server.close()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存至: {args.output}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量引擎吞吐基准测试(本地模拟接口)')
+    parser.add_argument('--tasks', type=int, default=100, help='每轮的任务数')
+    parser.add_argument('--engine', nargs='+', choices=['sync', 'async'], default=['sync', 'async'])
+    parser.add_argument('--max_workers', type=int, nargs='+', default=[1, 3, 8], help='要比较的并发数')
+    parser.add_argument('--latency', type=float, nargs=2, default=(2, 4), help='模拟的生成耗时范围(秒)')
+    parser.add_argument('--fail_rate', type=float, default=0.0, help='模拟的生成失败比例')
+    parser.add_argument('--server_submit_rate', type=float, default=None, help='模拟接口每秒受理的提交数，超出返回限流')
+    parser.add_argument('--download_size', type=int, default=1024 * 1024, help='模拟视频大小(字节)')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--check_interval', type=float, default=0.5)
+    parser.add_argument('--max_check_interval', type=float, default=5)
+    parser.add_argument('--download_workers', type=int, default=3)
+    parser.add_argument('--max_in_flight', type=int, default=0, help='0表示不限制')
+    parser.add_argument('--submit_rate', type=float, default=50, help='客户端提交限速(次/秒)')
+    parser.add_argument('--query_rate', type=float, default=100, help='客户端查询限速(次/秒)')
+    parser.add_argument('--output', help='把结果保存为JSON文件')
+    # 子进程参数
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--base_url', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--expected_latency', type=float, default=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.engine = args.engine[0] if isinstance(args.engine, list) else args.engine
+        args.max_workers = args.max_workers[0] if isinstance(args.max_workers, list) else args.max_workers
+        run_child(args)
+    else:
+        run_benchmark(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+__all__ = ['MockMiniMaxServer']
+
+
+class MockMiniMaxServer:
+    """
+    本地模拟的MiniMax视频生成接口，用于不花钱地测量批量引擎的吞吐
+
+    支持 /v1/video_generation、/v1/query/video_generation、/v1/files/retrieve、/v1/files/upload，
+    以及 /download/<file_id> 视频下载(支持Range断点续传)。
+    - latency: 任务生成耗时范围(秒)，每个任务在其中均匀随机
+    - queue_latency: 生成前在服务端排队(Queueing)的耗时范围(秒)
+    - fail_rate: 生成失败(Fail)的任务比例
+    - submit_rate: 每秒可受理的提交次数，超出时返回 1002 限流；为None时不限流
+    - balance_fail_rate: 提交返回 1008 余额不足的比例
+    - download_size: 视频文件大小(字节)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=(5, 10), queue_latency=(0, 0), fail_rate=0.0,
+                 submit_rate=None, balance_fail_rate=0.0, download_size=1024 * 1024, seed=None):
+        self.latency = latency
+        self.queue_latency = queue_latency
+        self.fail_rate = fail_rate
+        self.submit_rate = submit_rate
+        self.balance_fail_rate = balance_fail_rate
+        self.download_size = download_size
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self._tasks = {}
+        self._submit_times = []
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-minimax", daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self):
+        """清空任务和调用计数，供下一轮测试使用"""
+        with self._lock:
+            self.calls.clear()
+            self._tasks.clear()
+            self._submit_times.clear()
+
+    # ---------------- 接口逻辑 ----------------
+
+    def _ok(self, **fields):
+        return dict(fields, base_resp={'status_code': 0, 'status_msg': 'success'})
+
+    def _error(self, code, message):
+        return {'task_id': '', 'base_resp': {'status_code': code, 'status_msg': message}}
+
+    def submit(self, payload):
+        with self._lock:
+            now = time.monotonic()
+            if self.submit_rate:
+                self._submit_times = [t for t in self._submit_times if now - t < 1]
+                if len(self._submit_times) >= self.submit_rate:
+                    return self._error(1002, 'rate limit exceeded')
+                self._submit_times.append(now)
+            if self.random.random() < self.balance_fail_rate:
+                return self._error(1008, 'insufficient balance')
+            task_id = uuid.uuid4().hex
+            started_at = now + self.random.uniform(*self.queue_latency)
+            self._tasks[task_id] = {
+                'started_at': started_at,
+                'ready_at': started_at + self.random.uniform(*self.latency),
+                'fail': self.random.random() < self.fail_rate,
+                'model': payload.get('model'),
+            }
+        return self._ok(task_id=task_id)
+
+    def query(self, task_id):
+        with self._lock:
+            task = self._tasks.get(task_id)
+        if task is None:
+            return self._error(2013, 'task not found')
+        now = time.monotonic()
+        if now < task['started_at']:
+            return self._ok(task_id=task_id, status='Queueing')
+        if now < task['ready_at']:
+            return self._ok(task_id=task_id, status='Processing')
+        if task['fail']:
+            return self._ok(task_id=task_id, status='Fail')
+        return self._ok(task_id=task_id, status='Success', file_id=f"file-{task_id}")
+
+    def retrieve(self, file_id):
+        return self._ok(file={'file_id': file_id, 'bytes': self.download_size,
+                              'download_url': f"{self.base_url}/download/{file_id}"})
+
+    def upload(self):
+        return self._ok(file={'file_id': f"upload-{uuid.uuid4().hex}"})
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _send_json(self, result):
+                body = json.dumps(result).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _count(self, endpoint):
+                with mock._lock:
+                    mock.calls[endpoint] += 1
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if path == '/v1/video_generation':
+                    self._count('submit')
+                    self._send_json(mock.submit(json.loads(body or b'{}')))
+                elif path == '/v1/files/upload':
+                    self._count('upload')
+                    self._send_json(mock.upload())
+                else:
+                    self.send_error(404)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if url.path == '/v1/query/video_generation':
+                    self._count('query')
+                    self._send_json(mock.query(query.get('task_id', [''])[0]))
+                elif url.path == '/v1/files/retrieve':
+                    self._count('retrieve')
+                    self._send_json(mock.retrieve(query.get('file_id', [''])[0]))
+                elif url.path.startswith('/download/'):
+                    self._count('download')
+                    self._send_download()
+                else:
+                    self.send_error(404)
+
+            def _send_download(self):
+                size = mock.download_size
+                start, end = 0, size - 1
+                match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+                if match:
+                    start = int(match.group(1))
+                    end = int(match.group(2)) if match.group(2) else end
+                    if start >= size:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f"bytes */{size}")
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+                else:
+                    self.send_response(200)
+                length = end - start + 1
+                self.send_header('Content-Type', 'video/mp4')
+                self.send_header('Content-Length', str(length))
+                self.end_headers()
+                chunk = b'\0' * min(length, 64 * 1024)
+                remaining = length
+                while remaining > 0:
+                    self.wfile.write(chunk[:remaining])
+                    remaining -= len(chunk)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='本地模拟的MiniMax视频生成接口')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, nargs=2, default=(5, 10), help='生成耗时范围(秒)')
+    parser.add_argument('--queue_latency', type=float, nargs=2, default=(0, 0), help='服务端排队耗时范围(秒)')
+    parser.add_argument('--fail_rate', type=float, default=0.0)
+    parser.add_argument('--submit_rate', type=float, default=None)
+    parser.add_argument('--download_size', type=int, default=1024 * 1024)
+    args = parser.parse_args()
+    server = MockMiniMaxServer(port=args.port, latency=tuple(args.latency), queue_latency=tuple(args.queue_latency),
+                               fail_rate=args.fail_rate,
+                               submit_rate=args.submit_rate, download_size=args.download_size).start()
+    print(f"模拟接口已启动: {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.close()
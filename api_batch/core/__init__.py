@@ -0,0 +1,68 @@
+__all__ = [
+    "ApiKey",
+    "BatchJob",
+    "BatchMetrics",
+    "BatchPipeline",
+    "BatchRunner",
+    "DownloadError",
+    "DownloadPool",
+    "DownloadStats",
+    "EncodedImageCache",
+    "HttpTransport",
+    "ImagePreflight",
+    "JsonLinesFormatter",
+    "KeyPool",
+    "MetricsDumper",
+    "MetricsRegistry",
+    "MetricsServer",
+    "NoAvailableKeyError",
+    "PollScheduler",
+    "RateLimiter",
+    "RedactingFormatter",
+    "ReferenceImageUploader",
+    "ResultCache",
+    "TokenBucket",
+    "Tracer",
+    "batch_progress",
+    "downloadable_tasks",
+    "file_checksum",
+    "file_content_hash",
+    "format_latency_breakdown",
+    "get_logger",
+    "latency_breakdown",
+    "learn_expected_times",
+    "learn_expected_times_async",
+    "list_tasks",
+    "pollable_tasks",
+    "redact",
+    "register_secret",
+    "setup_logging",
+    "shutdown_logging",
+    "span",
+    "start_tracing",
+    "status_summary",
+    "stop_tracing",
+    "stream_download",
+    "task_filters",
+    "task_fingerprint",
+    "task_options",
+    "traced",
+]
+from .batch_runner import BatchJob, BatchRunner, batch_progress
+from .downloader import DownloadError, DownloadPool, DownloadStats, stream_download
+from .file_uploader import ReferenceImageUploader
+from .fingerprint import task_fingerprint
+from .image_cache import EncodedImageCache, file_content_hash
+from .image_preflight import ImagePreflight
+from .key_pool import ApiKey, KeyPool, NoAvailableKeyError
+from .log import JsonLinesFormatter, RedactingFormatter, get_logger, redact, register_secret, setup_logging, \
+    shutdown_logging
+from .metrics import BatchMetrics, MetricsDumper, MetricsRegistry, MetricsServer
+from .pipeline import BatchPipeline
+from .poll_scheduler import PollScheduler, learn_expected_times, learn_expected_times_async
+from .rate_limiter import RateLimiter, TokenBucket
+from .result_cache import ResultCache, file_checksum
+from .task_events import format_latency_breakdown, latency_breakdown
+from .task_monitor import downloadable_tasks, list_tasks, pollable_tasks, status_summary, task_filters, task_options
+from .tracing import Tracer, span, start_tracing, stop_tracing, traced
+from .transport import HttpTransport
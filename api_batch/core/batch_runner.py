@@ -0,0 +1,144 @@
+import queue
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from orm.video_task import TERMINAL_STATUSES, VideoTask
+from .log import get_logger
+
+__all__ = ['BatchJob', 'BatchRunner', 'batch_progress']
+
+logger = get_logger('batch_runner')
+
+
+class BatchJob:
+    """后台运行的一个批次"""
+
+    def __init__(self, generator, tasks, options):
+        self.id = uuid.uuid4().hex[:12]
+        self.generator = generator
+        self.tasks = tasks
+        self.options = options
+        self.status = 'Queued'
+        self.results = None
+        self.error = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def total(self):
+        return len(self.tasks)
+
+    @property
+    def done(self):
+        return self.status in ('Finished', 'Failed', 'Cancelled')
+
+
+class BatchRunner:
+    """
+    在后台线程中按顺序运行批次，调用方(如Streamlit页面)提交后立即返回
+
+    - 批次按提交顺序排队，同一时间只运行一个批次，避免多个批次争抢同一密钥的限速
+    - 每个批次以 batch_id 写入任务记录，进度由 batch_progress 从数据库读取
+    - 运行器只存在于当前进程内：进程退出时正在运行的批次中断，可用 --resume 从数据库接回
+    """
+
+    def __init__(self, max_history=50):
+        self.max_history = max_history
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, generator, tasks, **options):
+        """提交一个批次，options 为 process_batch 的参数；返回 BatchJob"""
+        job = BatchJob(generator, list(tasks), options)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="batch-runner", daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+        logger.info("批次 %s 已加入后台队列，共 %d 个任务", job.id, job.total)
+        return job
+
+    def cancel(self, batch_id):
+        """取消尚未开始的批次，返回是否取消成功"""
+        with self._lock:
+            job = self._jobs.get(batch_id)
+            if job is None or job.status != 'Queued':
+                return False
+            job.status = 'Cancelled'
+            job.finished_at = datetime.now()
+        logger.info("批次 %s 已取消", batch_id)
+        return True
+
+    def jobs(self):
+        """所有批次，最新提交的在前"""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def get(self, batch_id):
+        with self._lock:
+            return self._jobs.get(batch_id)
+
+    def busy(self):
+        """是否有排队或运行中的批次"""
+        with self._lock:
+            return any(not job.done for job in self._jobs.values())
+
+    def _trim(self):
+        """只保留最近 max_history 个已结束的批次"""
+        finished = [batch_id for batch_id, job in self._jobs.items() if job.done]
+        for batch_id in finished[:max(len(finished) - self.max_history, 0)]:
+            del self._jobs[batch_id]
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                if job.status != 'Queued':
+                    continue
+                job.status = 'Running'
+                job.started_at = datetime.now()
+            logger.info("批次 %s 开始运行", job.id)
+            try:
+                results = job.generator.process_batch(job.tasks, batch_id=job.id, **job.options)
+            except Exception as e:
+                logger.exception("批次 %s 运行出错", job.id)
+                with self._lock:
+                    job.status = 'Failed'
+                    job.error = str(e)
+                    job.finished_at = datetime.now()
+            else:
+                with self._lock:
+                    job.status = 'Finished'
+                    job.results = results
+                    job.finished_at = datetime.now()
+                logger.info("批次 %s 运行结束", job.id)
+
+
+def batch_progress(db, batch_ids):
+    """
+    从数据库统计各批次的任务状态
+
+    返回 {batch_id: {'statuses': {状态: 任务数}, 'recorded': 已写入的任务数, 'finished': 已结束的任务数}}
+    """
+    progress = {batch_id: {'statuses': {}, 'recorded': 0, 'finished': 0} for batch_id in batch_ids}
+    if not batch_ids:
+        return progress
+    query = (select(VideoTask.batch_id, VideoTask.status, func.count())
+             .where(VideoTask.batch_id.in_(list(batch_ids)))
+             .group_by(VideoTask.batch_id, VideoTask.status))
+    for batch_id, status, count in db.execute(query):
+        entry = progress[batch_id]
+        entry['statuses'][status] = count
+        entry['recorded'] += count
+        if status in TERMINAL_STATUSES:
+            entry['finished'] += count
+    return progress
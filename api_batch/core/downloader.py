@@ -0,0 +1,188 @@
+import os
+import queue
+import re
+import threading
+import time
+
+import requests
+
+from .log import get_logger
+
+__all__ = ['stream_download', 'DownloadError', 'DownloadStats', 'DownloadPool']
+
+logger = get_logger('downloader')
+
+_CONTENT_RANGE = re.compile(r'bytes\s+(?:(\d+)-\d+|\*)/(\d+|\*)')
+
+
+class DownloadError(IOError):
+    """下载内容不完整或服务端响应不符合预期"""
+
+
+def _parse_content_range(value):
+    """解析 Content-Range，返回 (起始偏移, 文件总大小)，无法解析的部分为None"""
+    match = _CONTENT_RANGE.match(value or '')
+    if not match:
+        return None, None
+    start, total = match.groups()
+    return (int(start) if start else None), (int(total) if total and total != '*' else None)
+
+
+def stream_download(transport, url, output_path, chunk_size=1024 * 1024, max_resumes=3):
+    """
+    流式下载文件到 output_path
+
+    - 分块写入 output_path + '.part'，内存占用与文件大小无关
+    - 已存在的 .part 文件(中断的下载)通过 HTTP Range 请求续传
+    - 下载完成后按 Content-Length 校验大小，再原子地重命名为最终文件
+    - 传输中途断开时最多续传 max_resumes 次
+    返回写入的字节数
+    """
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    part_path = output_path + '.part'
+
+    for attempt in range(max_resumes + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        try:
+            with transport.get(url, 'download', headers=headers, stream=True) as response:
+                if response.status_code == 416:
+                    # 续传起点超出文件大小：.part 已完整则直接收尾，否则重新下载
+                    _, total = _parse_content_range(response.headers.get('Content-Range'))
+                    if total is not None and total == offset:
+                        os.replace(part_path, output_path)
+                        return offset
+                    os.remove(part_path)
+                    continue
+
+                response.raise_for_status()
+                if offset and response.status_code == 206:
+                    start, total = _parse_content_range(response.headers.get('Content-Range'))
+                    if start != offset:
+                        raise DownloadError(f"续传起点不符: 期望 {offset}，实际 {start}")
+                    mode = 'ab'
+                else:
+                    # 服务端不支持Range时返回完整内容，从头写入
+                    offset = 0
+                    mode = 'wb'
+                    length = response.headers.get('Content-Length')
+                    total = int(length) if length is not None else None
+
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            f.write(chunk)
+                    f.flush()
+                    os.fsync(f.fileno())
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt >= max_resumes:
+                raise
+            logger.warning("下载中断，从已下载部分续传: %s", e)
+            continue
+
+        size = os.path.getsize(part_path)
+        if total is not None and size != total:
+            if attempt >= max_resumes:
+                raise DownloadError(f"文件大小不符: 期望 {total} 字节，实际 {size} 字节")
+            logger.warning("文件大小不符(期望 %s，实际 %s)，续传剩余部分", total, size)
+            continue
+
+        os.replace(part_path, output_path)
+        return size
+
+    raise DownloadError(f"下载失败: {url}")
+
+
+class DownloadStats:
+    """下载阶段的吞吐统计(线程安全)"""
+
+    def __init__(self):
+        self.completed = 0
+        self.failed = 0
+        self.bytes = 0
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, size=0, ok=True):
+        with self._lock:
+            if ok:
+                self.completed += 1
+                self.bytes += size
+            else:
+                self.failed += 1
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started_at, 1e-6)
+            return {
+                'completed': self.completed,
+                'failed': self.failed,
+                'bytes': self.bytes,
+                'elapsed': elapsed,
+                'mb_per_sec': self.bytes / elapsed / (1024 * 1024),
+                'files_per_min': self.completed / elapsed * 60,
+            }
+
+    def summary(self):
+        stats = self.snapshot()
+        return (f"下载完成 {stats['completed']} 个，失败 {stats['failed']} 个，"
+                f"共 {stats['bytes'] / (1024 * 1024):.1f} MB，"
+                f"{stats['mb_per_sec']:.2f} MB/s，{stats['files_per_min']:.1f} 个/分钟")
+
+
+class DownloadPool:
+    """
+    与状态轮询解耦的下载线程池
+
+    状态查询只把任务投递到队列，由 workers 个线程在后台下载，
+    轮询不会因为大文件传输而停顿。
+    - download_fn(task): 执行下载，返回输出文件路径
+    - on_done(task) / on_error(task, exception): 下载成功/失败的回调，在下载线程中执行
+    """
+
+    _STOP = object()
+
+    def __init__(self, download_fn, workers=3, queue_size=0, on_done=None, on_error=None):
+        self.download_fn = download_fn
+        self.on_done = on_done
+        self.on_error = on_error
+        self.stats = DownloadStats()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = [threading.Thread(target=self._worker, name=f"download-{i}", daemon=True)
+                         for i in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, task):
+        """投递下载任务，队列已满时阻塞"""
+        self._queue.put(task)
+
+    def pending(self):
+        """排队中尚未开始下载的任务数"""
+        return self._queue.qsize()
+
+    def close(self):
+        """等待队列中的下载全部完成后停止工作线程"""
+        for _ in self._threads:
+            self._queue.put(self._STOP)
+        for thread in self._threads:
+            thread.join()
+
+    def _worker(self):
+        while True:
+            task = self._queue.get()
+            if task is self._STOP:
+                return
+            try:
+                output_path = self.download_fn(task)
+                self.stats.record(os.path.getsize(output_path))
+                if self.on_done:
+                    self.on_done(task)
+            except Exception as e:
+                self.stats.record(ok=False)
+                if self.on_error:
+                    self.on_error(task, e)
+                else:
+                    logger.error("下载出错: %s", e)
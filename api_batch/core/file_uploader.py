@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+
+from orm.base import session_scope
+from orm.uploaded_file import UploadedFile
+from .image_cache import file_content_hash
+from .log import get_logger
+
+__all__ = ['ReferenceImageUploader']
+
+logger = get_logger('uploader')
+
+
+class ReferenceImageUploader:
+    """
+    通过文件接口上传参考图，并在任务间复用 file_id
+
+    - 每张不同的图片(按预处理后内容的sha256区分)只上传一次，file_id 记录在 uploaded_files 表中，跨批次复用
+    - 提交任务时通过 /v1/files/retrieve 将 file_id 换成下载链接作为图片URL，
+      链接在 url_ttl 秒内复用；同一图片的并发提交共用一次上传和查询，每张图片在 url_ttl 秒内最多查询一次
+    - 文件在服务端过期或被删除后，查询不到下载链接时删除记录并重新上传
+    """
+
+    def __init__(self, generator, purpose="video_generation", url_ttl=1800):
+        self.generator = generator
+        self.purpose = purpose
+        self.url_ttl = url_ttl
+        self.uploaded = 0
+        self.reused = 0
+        self._urls = {}
+        self._lock = threading.Lock()
+        self._upload_locks = {}
+        self._reference_locks = {}
+
+    def reference(self, image_path, model=None):
+        """返回可用于提交任务的图片URL；记录的 file_id 已失效(查询不到文件)时删除记录并重新上传一次"""
+        variant = f"file:{self.generator.preflight.settings_key(model)}" if self.generator.preflight else "file:raw"
+        key = (self.generator.image_cache.content_hash(image_path), variant)
+        with self._lock:
+            reference_lock = self._reference_locks.setdefault(key, threading.Lock())
+        # 同一图片的并发提交依次取得 file_id 和下载链接，后到的直接复用缓存结果，不重复上传和查询
+        with reference_lock:
+            for attempt in range(2):
+                file_id = self.generator.image_cache.get(image_path,
+                                                         lambda data: self._ensure_uploaded(data, image_path, model),
+                                                         variant=variant)
+                download_url, result = self._download_url(file_id)
+                if download_url:
+                    return download_url
+                if attempt:
+                    raise RuntimeError(f"查询参考图 {image_path} 的文件 {file_id} 失败: {result}")
+                logger.warning("参考图 %s 的文件 %s 已失效，重新上传: %s", image_path, file_id, result)
+                self._forget(file_id)
+                self.generator.image_cache.discard(image_path, variant)
+
+    def _ensure_uploaded(self, data, image_path, model):
+        if self.generator.preflight is not None:
+            data, mime = self.generator.preflight.process(data, model)
+        else:
+            mime = 'image/jpeg'
+        content_hash = file_content_hash(data)
+
+        # 同一内容并发提交时只上传一次
+        with self._lock:
+            upload_lock = self._upload_locks.setdefault(content_hash, threading.Lock())
+        with upload_lock:
+            file_id = self._lookup(content_hash)
+            if file_id:
+                self.reused += 1
+                return file_id
+
+            file_name = os.path.basename(image_path)
+            result = self.generator.upload_file(data, file_name, mime, self.purpose)
+            file_info = result.get('file') or {}
+            file_id = file_info.get('file_id')
+            if not file_id:
+                raise RuntimeError(f"上传参考图 {image_path} 失败: {result}")
+            file_id = str(file_id)
+            self._save(content_hash, file_id, file_name, len(data))
+            self.uploaded += 1
+            logger.info("参考图 %s 已上传，file_id: %s", image_path, file_id)
+            return file_id
+
+    def _download_url(self, file_id):
+        """返回 (下载链接, 查询结果)，文件不存在或已过期时下载链接为None"""
+        with self._lock:
+            cached = self._urls.get(file_id)
+            if cached and cached[1] > time.time():
+                return cached[0], None
+        result = self.generator.retrieve_file(file_id)
+        download_url = (result.get('file') or {}).get('download_url')
+        if not download_url:
+            return None, result
+        with self._lock:
+            self._urls[file_id] = (download_url, time.time() + self.url_ttl)
+        return download_url, result
+
+    def _lookup(self, content_hash):
+        with session_scope() as db:
+            record = db.query(UploadedFile).filter(UploadedFile.content_hash == content_hash).first()
+            return record.file_id if record else None
+
+    def _save(self, content_hash, file_id, file_name, size):
+        with session_scope() as db:
+            db.add(UploadedFile(content_hash=content_hash, file_id=file_id, filename=file_name,
+                                bytes=size, purpose=self.purpose))
+
+    def _forget(self, file_id):
+        """删除已失效的 file_id 记录；按 file_id 删除，其他任务已重新上传的新记录不受影响"""
+        with self._lock:
+            self._urls.pop(file_id, None)
+        with session_scope() as db:
+            db.query(UploadedFile).filter(UploadedFile.file_id == file_id).delete()
+
+    def summary(self):
+        return f"参考图上传：新上传 {self.uploaded} 张，复用此前上传的 {self.reused} 张"
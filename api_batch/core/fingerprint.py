@@ -0,0 +1,39 @@
+import hashlib
+import json
+import os
+
+__all__ = ['task_fingerprint']
+
+
+def task_fingerprint(task, content_hash):
+    """
+    任务的规范指纹
+
+    由 model、prompt、prompt_optimizer 以及参考图组成：本地图片取内容哈希(与路径无关)，URL原样保留；
+    只纳入实际会提交给接口的字段(subject_reference 仅S2V-01模型使用)。
+    content_hash(path) 返回本地文件内容的sha256。
+    """
+
+    def image_key(image):
+        if image and os.path.exists(image):
+            return f"sha256:{content_hash(image)}"
+        return image
+
+    model = task.get('model')
+    prompt_optimizer = task.get('prompt_optimizer')
+    canonical = {
+        'model': model,
+        'prompt': (task.get('prompt') or '').strip(),
+        # 未指定时接口默认开启提示词优化
+        'prompt_optimizer': True if prompt_optimizer is None else bool(prompt_optimizer),
+        'first_frame_image': image_key(task.get('first_frame_image')),
+        'subject_reference': None,
+    }
+    subject_reference = task.get('subject_reference')
+    if subject_reference and model == "S2V-01":
+        if not isinstance(subject_reference, list):
+            subject_reference = [subject_reference]
+        canonical['subject_reference'] = [image_key(image) for image in subject_reference]
+
+    encoded = json.dumps(canonical, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
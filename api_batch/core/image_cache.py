@@ -0,0 +1,111 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+__all__ = ['EncodedImageCache', 'file_content_hash']
+
+
+def file_content_hash(data):
+    """图片内容的sha256"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class EncodedImageCache:
+    """
+    编码后图片(data URI)的LRU缓存
+
+    - 以文件内容哈希为键，同一份图片无论路径如何只编码一次
+    - 路径的 (mtime, size) 未变化时直接复用上次计算的哈希，无需重新读取文件
+    - 按缓存内容的总字节数限制内存占用，超出 max_bytes 时淘汰最久未使用的条目
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._stat_index = {}
+        self._lock = threading.Lock()
+
+    def get(self, image_path, encoder, variant=''):
+        """
+        返回图片的编码结果
+
+        encoder(data) 接收图片原始字节，返回编码后的字符串，仅在未命中时调用；
+        同一图片有多种编码方式(如不同的预处理参数)时，用 variant 区分
+        """
+        path = os.path.abspath(image_path)
+        content_hash, data = self._hash(path)
+        key = (content_hash, variant)
+
+        with self._lock:
+            encoded = self._entries.get(key)
+            if encoded is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return encoded
+            self.misses += 1
+
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        encoded = encoder(data)
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = encoded
+                self._bytes += len(encoded)
+                while self._bytes > self.max_bytes and len(self._entries) > 1:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= len(evicted)
+        return encoded
+
+    def content_hash(self, image_path):
+        """文件内容的sha256，(mtime, size) 未变化时不重新读取文件"""
+        return self._hash(os.path.abspath(image_path))[0]
+
+    def _hash(self, path):
+        """返回 (内容哈希, 文件内容)，命中快速路径时文件内容为None"""
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            indexed = self._stat_index.get(path)
+            if indexed and indexed[0] == signature:
+                return indexed[1], None
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        content_hash = file_content_hash(data)
+        with self._lock:
+            self._stat_index[path] = (signature, content_hash)
+        return content_hash, data
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+            }
+
+    def summary(self):
+        stats = self.stats()
+        return (f"图片编码缓存：命中 {stats['hits']} 次，未命中 {stats['misses']} 次，"
+                f"缓存 {stats['entries']} 张共 {stats['bytes'] / (1024 * 1024):.1f} MB")
+
+    def discard(self, image_path, variant=''):
+        """移除图片某种编码方式的缓存结果，下次 get 时重新编码"""
+        key = (self.content_hash(image_path), variant)
+        with self._lock:
+            encoded = self._entries.pop(key, None)
+            if encoded is not None:
+                self._bytes -= len(encoded)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stat_index.clear()
+            self._bytes = 0
@@ -0,0 +1,91 @@
+import io
+import os
+
+from PIL import Image, ImageOps
+
+from .image_cache import file_content_hash
+
+__all__ = ['ImagePreflight']
+
+
+class ImagePreflight:
+    """
+    提交前的图片预处理
+
+    - 按模型可用的最大分辨率等比缩小(不放大)，并修正EXIF方向
+    - 重新压缩为JPEG；处理后反而更大时保留原图
+    - 按实际格式给出MIME类型，不再把PNG标成image/jpeg
+    - 结果按 源图内容哈希 + 处理参数 缓存在磁盘上，重复运行不再重复处理
+    """
+
+    # 01系列模型输出720P，长边超过1280的像素对生成没有帮助
+    DEFAULT_MAX_SIDE = 1280
+    MODEL_MAX_SIDE = {
+        'MiniMax-Hailuo-02': 1920,
+    }
+    MIME_TYPES = {
+        'JPEG': 'image/jpeg',
+        'PNG': 'image/png',
+        'WEBP': 'image/webp',
+    }
+
+    def __init__(self, cache_dir="cache/preflight", quality=90, max_side=None):
+        """max_side 为None时按模型取 MODEL_MAX_SIDE / DEFAULT_MAX_SIDE"""
+        self.cache_dir = cache_dir
+        self.quality = quality
+        self.max_side = max_side
+
+    def max_side_for(self, model):
+        if self.max_side:
+            return self.max_side
+        return self.MODEL_MAX_SIDE.get(model, self.DEFAULT_MAX_SIDE)
+
+    def settings_key(self, model):
+        """处理参数的标识，与源图哈希一起组成缓存键"""
+        return f"s{self.max_side_for(model)}q{self.quality}"
+
+    def process(self, data, model=None):
+        """处理图片原始字节，返回 (处理后的字节, MIME类型)"""
+        cache_key = f"{file_content_hash(data)}_{self.settings_key(model)}"
+        for ext, mime in (('jpg', 'image/jpeg'), ('png', 'image/png'), ('webp', 'image/webp')):
+            cached_path = os.path.join(self.cache_dir, f"{cache_key}.{ext}")
+            if os.path.exists(cached_path):
+                with open(cached_path, 'rb') as f:
+                    return f.read(), mime
+
+        result, mime = self._convert(data, self.max_side_for(model))
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        ext = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/webp': 'webp'}[mime]
+        cached_path = os.path.join(self.cache_dir, f"{cache_key}.{ext}")
+        tmp_path = f"{cached_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(result)
+        os.replace(tmp_path, cached_path)
+        return result, mime
+
+    def _convert(self, data, max_side):
+        with Image.open(io.BytesIO(data)) as image:
+            original_mime = self.MIME_TYPES.get(image.format)
+            image = ImageOps.exif_transpose(image)
+            resized = max(image.size) > max_side
+            if resized:
+                image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+            # 透明通道铺白底后转为RGB
+            if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=self.quality, optimize=True, progressive=True)
+            result = buffer.getvalue()
+
+        # 未缩放且重新压缩没有变小时，原图更合适
+        if not resized and original_mime and len(result) >= len(data):
+            return data, original_mime
+        return result, 'image/jpeg'
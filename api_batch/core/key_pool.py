@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from .log import get_logger, register_secret
+from .rate_limiter import RateLimiter
+
+__all__ = ['ApiKey', 'KeyPool', 'NoAvailableKeyError']
+
+logger = get_logger('key_pool')
+
+
+class NoAvailableKeyError(RuntimeError):
+    """所有密钥都已余额不足或被暂停"""
+
+
+class ApiKey:
+    """
+    密钥池中的单个API密钥
+
+    - 每个密钥使用独立的限流器，限速互不影响
+    - balance 为该密钥还能提交的任务数(由配置给出，每次提交成功减1)，为None表示不限
+    """
+
+    def __init__(self, key, name=None, rate_limits=None, balance=None):
+        self.key = key
+        register_secret(key)
+        self.id = name or f"key-{hashlib.sha256(key.encode('utf-8')).hexdigest()[:8]}"
+        self.headers = {
+            'Authorization': f'Bearer {key}',
+            'Content-Type': 'application/json'
+        }
+        self.limiter = RateLimiter(rate_limits)
+        self.initial_balance = balance
+        self.balance = balance
+        self.assigned = 0
+        self.suspended_until = 0
+        # 暂停是否因为余额不足：余额不足的密钥短时间内不会恢复，不值得等待
+        self.balance_suspended = False
+        self.exhausted = False
+
+    def available(self, now):
+        return not self.exhausted and self.suspended_until <= now
+
+    def weight(self):
+        """分配权重：当前提交速率，配置了余额时再乘以剩余余额比例"""
+        weight = self.limiter.buckets['submit'].rate
+        if self.initial_balance:
+            weight *= max(self.balance, 0) / self.initial_balance
+        return weight
+
+    def __repr__(self):
+        return f"ApiKey({self.id})"
+
+
+class KeyPool:
+    """
+    多个API密钥组成的密钥池
+
+    - 提交任务时按各密钥的提交速率和剩余余额加权分配，选择 已分配数/权重 最小的可用密钥
+    - 返回余额不足的密钥移出轮换(balance_cooldown 秒后重新尝试)，触发限流的密钥暂停 cooldown 秒
+    - 所有密钥都不可用时，只等待限流暂停的密钥恢复；余额不足的密钥不等待，直接抛出 NoAvailableKeyError
+    - 查询状态和下载时按任务记录的密钥ID取回同一个密钥
+    """
+
+    # 1008: 余额不足
+    BALANCE_CODES = (1008,)
+
+    def __init__(self, keys, rate_limits=None, cooldown=60, balance_cooldown=3600):
+        """keys: 密钥字符串或 ApiKey 的列表，第一个为默认密钥"""
+        self.keys = [key if isinstance(key, ApiKey) else ApiKey(key, rate_limits=rate_limits) for key in keys]
+        if not self.keys:
+            raise ValueError("密钥池中至少需要一个API密钥")
+        self.cooldown = cooldown
+        self.balance_cooldown = balance_cooldown
+        self._by_id = {key.id: key for key in self.keys}
+        self._lock = threading.Lock()
+
+    @property
+    def default(self):
+        return self.keys[0]
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_env(cls, rate_limits=None, **kwargs):
+        """从环境变量读取密钥：API_KEYS 为逗号分隔的多个密钥，或 API_KEY 单个密钥"""
+        value = os.getenv('API_KEYS') or os.getenv('API_KEY') or ''
+        return cls([key.strip() for key in value.split(',') if key.strip()], rate_limits, **kwargs)
+
+    @classmethod
+    def from_file(cls, path, rate_limits=None, **kwargs):
+        """
+        从JSON配置文件读取密钥，格式为密钥字符串列表，或：
+        [{"key": "...", "name": "主账号", "balance": 200, "rate_limits": {"submit": [1, 5]}}, ...]
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        keys = []
+        for entry in entries:
+            if isinstance(entry, str):
+                entry = {'key': entry}
+            limits = dict(rate_limits or {})
+            limits.update({kind: tuple(limit) for kind, limit in (entry.get('rate_limits') or {}).items()})
+            keys.append(ApiKey(entry['key'], name=entry.get('name'), rate_limits=limits,
+                               balance=entry.get('balance')))
+        return cls(keys, **kwargs)
+
+    def get(self, key_id):
+        """按ID取密钥，未记录或已不在池中时返回默认密钥"""
+        if key_id and key_id not in self._by_id:
+            logger.warning("密钥 %s 不在密钥池中，改用默认密钥", key_id)
+        return self._by_id.get(key_id, self.default)
+
+    def choose(self):
+        """为新任务选择密钥；全部暂停时等待最早从限流中恢复的密钥，其余密钥全部余额不足时抛出 NoAvailableKeyError"""
+        while True:
+            with self._lock:
+                now = time.time()
+                candidates = [key for key in self.keys if key.available(now)]
+                if candidates:
+                    key = min(candidates, key=lambda k: (k.assigned + 1) / max(k.weight(), 1e-9))
+                    key.assigned += 1
+                    return key
+                waiting = [key.suspended_until for key in self.keys
+                           if not key.exhausted and not key.balance_suspended]
+                if not waiting:
+                    raise NoAvailableKeyError("密钥池中所有API密钥都已余额不足")
+                wait = min(waiting) - now
+            time.sleep(max(wait, 0.1))
+
+    def observe(self, key, result):
+        """
+        根据提交结果更新密钥状态，返回该结果是否应换一个密钥重试
+
+        余额不足的密钥暂停 balance_cooldown 秒，限流的密钥暂停 cooldown 秒；
+        只有一个密钥时无处换用，不暂停密钥：余额不足的任务直接失败，限流由限流器降速重试
+        """
+        status_code = (result.get('base_resp') or {}).get('status_code') if isinstance(result, dict) else None
+        if len(self.keys) == 1:
+            status_code = None
+        with self._lock:
+            if status_code in self.BALANCE_CODES:
+                key.suspended_until = time.time() + self.balance_cooldown
+                key.balance_suspended = True
+                logger.warning("密钥 %s 余额不足，暂停使用 %s 秒", key.id, self.balance_cooldown)
+                return True
+            if status_code in RateLimiter.RATE_LIMIT_CODES:
+                key.suspended_until = time.time() + self.cooldown
+                key.balance_suspended = False
+                logger.warning("密钥 %s 触发限流，暂停使用 %s 秒", key.id, self.cooldown)
+                return True
+            if isinstance(result, dict) and result.get('task_id') and key.balance is not None:
+                key.balance -= 1
+                if key.balance <= 0:
+                    key.exhausted = True
+                    logger.warning("密钥 %s 配置的余额已用完", key.id)
+            return False
+
+    def summary(self):
+        parts = []
+        for key in self.keys:
+            balance = '' if key.balance is None else f"，剩余 {key.balance}"
+            parts.append(f"{key.id} 分配 {key.assigned} 个{balance}")
+        return "密钥池：" + "；".join(parts)
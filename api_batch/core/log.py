@@ -0,0 +1,131 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+__all__ = ['JsonLinesFormatter', 'RedactingFormatter', 'get_logger', 'redact', 'register_secret', 'setup_logging',
+           'shutdown_logging']
+
+ROOT_LOGGER = 'hailuo'
+TEXT_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+# 日志中的密钥脱敏：Bearer令牌、JWT形式的API密钥、常见的密钥字段
+_PATTERNS = (
+    (re.compile(r'(Bearer\s+)[A-Za-z0-9._~+/=-]+'), r'\1***'),
+    (re.compile(r'eyJ[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+'), '***'),
+    (re.compile(r'''(['"]?(?:api_key|authorization|cookie|token|secret|password)['"]?\s*[:=]\s*['"]?)'''
+                r'''(?!Bearer\s)[^'",\s}]+''', re.IGNORECASE), r'\1***'),
+)
+_secrets = set()
+_secrets_lock = threading.Lock()
+
+_listener = None
+_queue_handler = None
+_setup_lock = threading.Lock()
+
+
+def register_secret(value):
+    """登记需要在日志中隐藏的字符串(如密钥池中的API密钥)"""
+    if value and len(value) >= 8:
+        with _secrets_lock:
+            _secrets.add(value)
+
+
+def redact(text):
+    """把文本中的密钥替换为 ***"""
+    for pattern, replacement in _PATTERNS:
+        text = pattern.sub(replacement, text)
+    for secret in _secrets:
+        if secret in text:
+            text = text.replace(secret, '***')
+    return text
+
+
+def get_logger(name):
+    """返回 hailuo 命名空间下的logger，由 setup_logging 统一配置输出"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+class RedactingFormatter(logging.Formatter):
+    """文本格式，输出前脱敏"""
+
+    def format(self, record):
+        return redact(super().format(record))
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """每条日志一行JSON，便于日志系统采集；logger调用时 extra 中的字段一并输出"""
+
+    _RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self._RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return redact(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+def setup_logging(level=None, json_lines=None, log_file=None):
+    """
+    配置 hailuo 命名空间的日志输出
+
+    调用方线程只把日志记录放入队列，由后台线程格式化、脱敏并写出，不会因为stdout阻塞批量处理。
+    - level: 日志级别，默认读取环境变量 LOG_LEVEL，再退回 INFO
+    - json_lines: 控制台是否输出JSON行，默认读取环境变量 LOG_FORMAT=json
+    - log_file: 另外以JSON行格式写入该文件，默认读取环境变量 LOG_FILE
+    重复调用时按新配置替换原有输出。
+    """
+    global _listener, _queue_handler
+    level = (level or os.getenv('LOG_LEVEL') or 'INFO').upper()
+    if json_lines is None:
+        json_lines = os.getenv('LOG_FORMAT', '').lower() == 'json'
+    log_file = log_file or os.getenv('LOG_FILE')
+
+    console = logging.StreamHandler(sys.stderr)
+    console.setFormatter(JsonLinesFormatter() if json_lines else RedactingFormatter(TEXT_FORMAT))
+    handlers = [console]
+    if log_file:
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        file_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(file_handler)
+
+    with _setup_lock:
+        shutdown_logging()
+        records = queue.SimpleQueue()
+        _queue_handler = QueueHandler(records)
+        _listener = QueueListener(records, *handlers, respect_handler_level=True)
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(level)
+        root.addHandler(_queue_handler)
+        root.propagate = False
+        _listener.start()
+    return root
+
+
+def shutdown_logging():
+    """写出队列中剩余的日志并停止后台线程"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        logging.getLogger(ROOT_LOGGER).removeHandler(_queue_handler)
+        _listener = _queue_handler = None
+
+
+atexit.register(shutdown_logging)
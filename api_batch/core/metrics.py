@@ -0,0 +1,257 @@
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .log import get_logger
+
+__all__ = ['BatchMetrics', 'Counter', 'Gauge', 'Histogram', 'MetricsRegistry', 'MetricsServer',
+           'MetricsDumper']
+
+logger = get_logger('metrics')
+
+# 接口调用延迟(秒)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 下载耗时(秒)
+DOWNLOAD_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# 从提交到视频下载完成的端到端耗时(秒)
+GENERATION_BUCKETS = (30, 60, 120, 180, 300, 600, 900, 1800, 3600)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+    def _format_labels(self, key, extra=None):
+        pairs = list(zip(self.labels, key)) + list(extra or [])
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            return [f"{self.name}{self._format_labels(key)} {value}" for key, value in self._values.items()]
+
+    def snapshot(self):
+        with self._lock:
+            return {','.join(key) or '': value for key, value in self._values.items()}
+
+
+class Gauge(Counter):
+    """可任意设置的瞬时值，如队列深度"""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """按固定分桶统计分布，同时记录总和与次数"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """上下文管理器：统计代码块的耗时"""
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+    def snapshot(self):
+        with self._lock:
+            return {','.join(key) or '': {'count': count, 'sum': total, 'avg': total / count if count else 0}
+                    for key, (counts, total, count) in self._values.items()}
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class MetricsRegistry:
+    """指标注册表，负责输出Prometheus文本格式和JSON快照"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        """Prometheus文本格式(text/plain; version=0.0.4)"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+class BatchMetrics:
+    """
+    批量生成引擎的指标
+
+    - hailuo_api_calls_total{kind, code}: 各类型接口调用次数，code 为 base_resp.status_code(无则为HTTP状态码)
+    - hailuo_api_latency_seconds{kind}: 提交/查询/获取文件/上传的接口延迟
+    - hailuo_download_seconds / hailuo_download_bytes_total: 视频下载耗时与字节数
+    - hailuo_generation_seconds{model}: 从提交到视频下载完成的端到端耗时
+    - hailuo_tasks_total{status}: 结束的任务数(Completed / Failed / Cached ...)
+    - hailuo_queue_depth{stage}: 各阶段排队中的任务数
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry or MetricsRegistry()
+        r = self.registry
+        self.api_calls = r.counter('hailuo_api_calls_total', '接口调用次数', ('kind', 'code'))
+        self.api_latency = r.histogram('hailuo_api_latency_seconds', '接口调用延迟(秒)', ('kind',))
+        self.download_latency = r.histogram('hailuo_download_seconds', '视频下载耗时(秒)', (),
+                                            DOWNLOAD_BUCKETS)
+        self.download_bytes = r.counter('hailuo_download_bytes_total', '已下载的视频字节数')
+        self.generation_time = r.histogram('hailuo_generation_seconds', '从提交到下载完成的耗时(秒)',
+                                           ('model',), GENERATION_BUCKETS)
+        self.tasks = r.counter('hailuo_tasks_total', '已结束的任务数', ('status',))
+        self.queue_depth = r.gauge('hailuo_queue_depth', '各阶段排队中的任务数', ('stage',))
+
+
+class MetricsServer:
+    """在后台线程中提供 /metrics 接口，供Prometheus抓取"""
+
+    def __init__(self, registry, port=9108, host='0.0.0.0'):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logger.info("指标接口已启动: http://%s:%s/metrics", *self.server.server_address[:2])
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsDumper:
+    """每隔 interval 秒把指标快照写入JSON文件(先写临时文件再替换，读取方不会读到半个文件)"""
+
+    def __init__(self, registry, path, interval=30):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-dumper", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.dump()
+
+    def dump(self):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'time': time.time(), 'metrics': self.registry.snapshot()}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error("写入指标文件出错: %s", e)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.dump()
@@ -0,0 +1,226 @@
+import asyncio
+import os
+
+from tqdm import tqdm
+
+from orm.base import async_enabled, async_session_scope, session_scope
+from .downloader import DownloadStats
+from .log import get_logger
+from .poll_scheduler import PollScheduler, learn_expected_times, learn_expected_times_async
+
+__all__ = ['BatchPipeline']
+
+logger = get_logger('pipeline')
+
+# 阶段结束标记
+_DONE = object()
+
+
+class BatchPipeline:
+    """
+    提交 / 轮询 / 下载 三阶段并发的批量任务流水线
+
+    - 提交阶段：max_workers 个协程从提交队列取任务并调用生成接口，服务端在途任务数不超过 max_in_flight
+    - 轮询阶段：持续收取已提交的任务，由 PollScheduler 按各任务的下次查询时间查询状态
+    - 下载阶段：download_workers 个协程下载已成功的视频
+    阶段之间通过有界队列衔接，下游变慢时会对上游形成背压。
+    接口调用均为阻塞的requests请求，通过 asyncio.to_thread 放入线程执行。
+    """
+
+    def __init__(self, generator, output_dir="output", max_workers=3, check_interval=5, max_check_interval=60,
+                 download_workers=3, queue_size=100, max_in_flight=None, cache_policy='always', cache_max_age=None,
+                 batch_id=None):
+        self.generator = generator
+        self.output_dir = output_dir
+        self.max_workers = max_workers
+        self.check_interval = check_interval
+        self.max_check_interval = max(check_interval, max_check_interval)
+        self.download_workers = download_workers
+        self.queue_size = queue_size
+        self.max_in_flight = max_in_flight
+        self.cache_policy = cache_policy
+        self.cache_max_age = cache_max_age
+        self.batch_id = batch_id
+        self.task_info = []
+        self._seq = 0
+
+    async def run(self, tasks):
+        """执行整个批次，返回与 process_batch 相同结构的任务信息列表"""
+        self.generator.result_cache.check_policy(self.cache_policy, self.cache_max_age)
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        self.submit_queue = asyncio.Queue(maxsize=self.queue_size)
+        self.poll_queue = asyncio.Queue(maxsize=self.queue_size)
+        self.download_queue = asyncio.Queue(maxsize=self.queue_size)
+        self.poll_slots = asyncio.Semaphore(self.max_workers)
+        self.download_stats = DownloadStats()
+        # 在途窗口：同时在服务端排队/生成的任务数上限
+        self.in_flight = asyncio.Semaphore(self.max_in_flight) if self.max_in_flight else None
+        self.progress_bar = tqdm(desc="视频生成进度")
+
+        feeder = asyncio.create_task(self._feed(tasks))
+        submitters = [asyncio.create_task(self._submit_worker()) for _ in range(self.max_workers)]
+        poller = asyncio.create_task(self._poll_stage())
+        downloaders = [asyncio.create_task(self._download_worker()) for _ in range(self.download_workers)]
+
+        # 按阶段顺序依次收尾：上游结束后向下游发送结束标记
+        await feeder
+        await asyncio.gather(*submitters)
+        await self.poll_queue.put(_DONE)
+        await poller
+        for _ in downloaders:
+            await self.download_queue.put(_DONE)
+        await asyncio.gather(*downloaders)
+        for stage in ('submit', 'poll', 'download'):
+            self.generator.metrics.queue_depth.set(0, stage=stage)
+        await asyncio.to_thread(self.generator.writer.flush)
+
+        self.progress_bar.close()
+        self.generator.log_summary(self.download_stats)
+        self.generator.write_report(self.task_info, self.output_dir)
+        return self.task_info
+
+    async def _feed(self, tasks):
+        for task in tasks:
+            await self.submit_queue.put(task)
+        for _ in range(self.max_workers):
+            await self.submit_queue.put(_DONE)
+
+    # ---------------- 提交阶段 ----------------
+
+    async def _submit_worker(self):
+        while True:
+            original_task = await self.submit_queue.get()
+            if original_task is _DONE:
+                return
+            if self.in_flight is not None:
+                await self.in_flight.acquire()
+            self._seq += 1
+            task = await asyncio.to_thread(self._submit, self._seq, original_task)
+            self.task_info.append(task)
+            if self.generator.needs_tracking(task):
+                await self.poll_queue.put(task)
+            else:
+                self._leave_provider()
+                self.progress_bar.update(1)
+
+    def _submit(self, index, original_task):
+        try:
+            return self.generator.submit_task(original_task, index, self.output_dir,
+                                              self.cache_policy, self.cache_max_age, self.batch_id)
+        except Exception as e:
+            logger.error("任务 %s 写入数据库出错: %s", index, e)
+            return {'task_id': None, 'status': 'Error', 'error': str(e), 'original_task': original_task}
+
+    def _leave_provider(self):
+        """任务在服务端结束(生成完成/失败)或未能提交，释放在途窗口"""
+        if self.in_flight is not None:
+            self.in_flight.release()
+
+    # ---------------- 轮询阶段 ----------------
+
+    async def _poll_stage(self):
+        scheduler = PollScheduler(await self._learn_expected_times(),
+                                  min_interval=self.check_interval,
+                                  max_interval=self.max_check_interval)
+        submit_done = False
+
+        while True:
+            # 收取新提交的任务；没有到期任务时最多等待到下一个任务到期
+            timeout = scheduler.next_due_in()
+            while not submit_done:
+                try:
+                    if timeout is None:
+                        task = await self.poll_queue.get()
+                    elif timeout > 0:
+                        task = await asyncio.wait_for(self.poll_queue.get(), timeout)
+                    else:
+                        task = self.poll_queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if task is _DONE:
+                    submit_done = True
+                else:
+                    scheduler.add(task, task['original_task'].get('model'), task.get('submitted_at'))
+                    timeout = 0
+
+            if not scheduler:
+                if submit_done:
+                    return
+                continue
+
+            self._record_queue_depth(scheduler)
+            due_tasks = scheduler.pop_due()
+            if not due_tasks:
+                if submit_done:
+                    await asyncio.sleep(scheduler.next_due_in())
+                continue
+
+            results = await asyncio.gather(*(self._check(task) for task in due_tasks))
+            updates = []
+            for task, status_info in zip(due_tasks, results):
+                if status_info is not None and await self._handle_status(task, status_info, updates):
+                    scheduler.discard(task)
+                    self._leave_provider()
+                else:
+                    scheduler.reschedule(task)
+
+            # 本轮查询产生的状态变化在一个事务中写入
+            if updates:
+                self.generator.update_task_records(updates)
+
+    def _record_queue_depth(self, scheduler):
+        queue_depth = self.generator.metrics.queue_depth
+        queue_depth.set(self.submit_queue.qsize(), stage='submit')
+        queue_depth.set(self.poll_queue.qsize() + len(scheduler), stage='poll')
+        queue_depth.set(self.download_queue.qsize(), stage='download')
+
+    async def _learn_expected_times(self):
+        """启用异步数据库会话时直接在事件循环中查询，否则放入线程执行同步查询"""
+        if async_enabled():
+            async with async_session_scope() as db:
+                return await learn_expected_times_async(db)
+        return await asyncio.to_thread(self._learn_expected_times_sync)
+
+    def _learn_expected_times_sync(self):
+        with session_scope() as db:
+            return learn_expected_times(db)
+
+    async def _check(self, task):
+        async with self.poll_slots:
+            try:
+                return await asyncio.to_thread(self.generator.check_task_status, task['task_id'],
+                                               task.get('api_key_id'))
+            except Exception as e:
+                logger.error("检查任务 %s 状态出错: %s", task['task_id'], e)
+                return None
+
+    async def _handle_status(self, task, status_info, updates):
+        """处理一次状态查询结果，需写入数据库的变化追加到updates，任务离开轮询阶段时返回True"""
+        outcome = self.generator.apply_status(task, status_info, updates)
+        if outcome == 'download':
+            await self.download_queue.put(task)
+            return True
+        if outcome == 'failed':
+            self.progress_bar.update(1)
+            return True
+        return False
+
+    # ---------------- 下载阶段 ----------------
+
+    async def _download_worker(self):
+        while True:
+            task = await self.download_queue.get()
+            if task is _DONE:
+                return
+            await asyncio.to_thread(self._download, task)
+            self.progress_bar.update(1)
+
+    def _download(self, task):
+        try:
+            output_path = self.generator.download_task(task)
+            self.download_stats.record(os.path.getsize(output_path))
+            self.generator.mark_downloaded(task)
+        except Exception as e:
+            self.download_stats.record(ok=False)
+            self.generator.mark_download_failed(task, e)
@@ -0,0 +1,111 @@
+import heapq
+import itertools
+import statistics
+import time
+
+from sqlalchemy import select
+
+from orm.video_task import VideoTask
+
+__all__ = ['PollScheduler', 'learn_expected_times', 'learn_expected_times_async']
+
+
+def _expected_times_query(sample_size):
+    # 复用结果缓存的记录没有task_id，提交和完成时间几乎相同，不能作为生成耗时的样本
+    return (select(VideoTask.model, VideoTask.submit_time, VideoTask.complete_time)
+            .where(VideoTask.status == 'Completed',
+                   VideoTask.task_id.isnot(None),
+                   VideoTask.task_id != '',
+                   VideoTask.submit_time.isnot(None),
+                   VideoTask.complete_time.isnot(None))
+            .order_by(VideoTask.complete_time.desc())
+            .limit(sample_size * 20))
+
+
+def _median_durations(rows, sample_size):
+    durations = {}
+    for model, submit_time, complete_time in rows:
+        samples = durations.setdefault(model, [])
+        if len(samples) < sample_size:
+            samples.append((complete_time - submit_time).total_seconds())
+    return {model: statistics.median(samples) for model, samples in durations.items() if samples}
+
+
+def learn_expected_times(db, sample_size=200):
+    """
+    从历史任务中学习各模型的生成耗时
+
+    取每个模型最近 sample_size 个已完成任务 complete_time - submit_time 的中位数(秒)
+    """
+    rows = db.execute(_expected_times_query(sample_size)).all()
+    return _median_durations(rows, sample_size)
+
+
+async def learn_expected_times_async(db, sample_size=200):
+    """learn_expected_times 的异步版本，db 为 AsyncSession"""
+    rows = (await db.execute(_expected_times_query(sample_size))).all()
+    return _median_durations(rows, sample_size)
+
+
+class PollScheduler:
+    """
+    按任务各自的下次查询时间组织的轮询调度器
+
+    - 任务提交后，在模型预期生成耗时的 first_poll_ratio 处才开始第一次查询
+    - 之后每次查询仍未完成，查询间隔从 min_interval 起按 backoff_factor 指数增长，最长 max_interval
+    - 所有任务按下次查询时间存放在最小堆中，每次只取出已到期的任务
+    """
+
+    def __init__(self, expected_times=None, default_expected=60, min_interval=5, max_interval=60,
+                 backoff_factor=1.5, first_poll_ratio=0.8):
+        """expected_times: {模型: 预期生成耗时(秒)}，可由 learn_expected_times 得到"""
+        self.expected_times = expected_times or {}
+        self.default_expected = default_expected
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.first_poll_ratio = first_poll_ratio
+        self._heap = []
+        self._seq = itertools.count()
+        self._attempts = {}
+
+    def __len__(self):
+        return len(self._heap)
+
+    def expected_time(self, model):
+        return self.expected_times.get(model, self.default_expected)
+
+    def add(self, task, model=None, submitted_at=None):
+        """加入新提交的任务，submitted_at 为 time.time() 时间戳，默认为当前时间"""
+        submitted_at = time.time() if submitted_at is None else submitted_at
+        first_poll = submitted_at + self.expected_time(model) * self.first_poll_ratio
+        self._attempts[id(task)] = 0
+        self._push(max(first_poll, time.time()), task)
+
+    def reschedule(self, task):
+        """任务仍未完成(或查询出错)，按退避间隔安排下次查询"""
+        attempts = self._attempts.get(id(task), 0)
+        interval = min(self.max_interval, self.min_interval * (self.backoff_factor ** attempts))
+        self._attempts[id(task)] = attempts + 1
+        self._push(time.time() + interval, task)
+
+    def discard(self, task):
+        """任务已结束，清理其退避状态"""
+        self._attempts.pop(id(task), None)
+
+    def pop_due(self, now=None):
+        """取出所有已到查询时间的任务"""
+        now = time.time() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def next_due_in(self):
+        """距离最近一个任务到期的秒数，堆为空时返回None"""
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - time.time())
+
+    def _push(self, when, task):
+        heapq.heappush(self._heap, (when, next(self._seq), task))
@@ -0,0 +1,105 @@
+import threading
+import time
+
+from .log import get_logger
+
+__all__ = ['TokenBucket', 'RateLimiter']
+
+logger = get_logger('rate_limiter')
+
+
+class TokenBucket:
+    """线程安全的令牌桶，rate为每秒补充的令牌数，burst为桶容量"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """取一个令牌，令牌不足时阻塞等待"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self):
+        """清空令牌，使后续请求立即按新速率排队"""
+        with self._lock:
+            self._refill()
+            self._tokens = 0
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+
+class RateLimiter:
+    """
+    按调用类型分别限速的限流器
+
+    - submit / query / retrieve / upload 各自使用独立的令牌桶
+    - 接口在 base_resp 中返回限流状态码时，该类型的速率按 decrease_factor 成倍下降
+    - 之后每次正常响应按配置速率的 recovery_step 比例逐步恢复，直到回到配置速率
+    """
+
+    DEFAULT_LIMITS = {
+        # 调用类型: (每秒请求数, 突发容量)
+        'submit': (0.5, 3),
+        'query': (5, 10),
+        'retrieve': (5, 5),
+        'upload': (1, 2),
+    }
+    # 1002: 触发限流, 1039: 触发TPM限流
+    RATE_LIMIT_CODES = (1002, 1039)
+
+    def __init__(self, limits=None, decrease_factor=0.5, recovery_step=0.05, min_rate=0.05):
+        """limits: 如 {'submit': (1, 5)}，未指定的类型使用默认值"""
+        config = dict(self.DEFAULT_LIMITS)
+        config.update(limits or {})
+        self.limits = config
+        self.decrease_factor = decrease_factor
+        self.recovery_step = recovery_step
+        self.min_rate = min_rate
+        self.buckets = {kind: TokenBucket(rate, burst) for kind, (rate, burst) in config.items()}
+        self.throttled_count = {kind: 0 for kind in config}
+        self._lock = threading.Lock()
+
+    def acquire(self, kind):
+        """调用接口前取令牌"""
+        self.buckets[kind].acquire()
+
+    def observe(self, kind, result):
+        """根据接口返回结果调整速率，返回本次是否被限流"""
+        status_code = (result.get('base_resp') or {}).get('status_code') if isinstance(result, dict) else None
+        bucket = self.buckets[kind]
+        configured_rate = self.limits[kind][0]
+
+        with self._lock:
+            if status_code in self.RATE_LIMIT_CODES:
+                self.throttled_count[kind] += 1
+                new_rate = max(self.min_rate, bucket.rate * self.decrease_factor)
+                logger.warning("[%s] 触发限流，速率降至 %.2f 次/秒", kind, new_rate)
+                bucket.set_rate(new_rate)
+                bucket.drain()
+                return True
+
+            if bucket.rate < configured_rate:
+                bucket.set_rate(min(configured_rate, bucket.rate + configured_rate * self.recovery_step))
+            return False
+
+    def current_rates(self):
+        """各类型当前的速率(次/秒)"""
+        return {kind: bucket.rate for kind, bucket in self.buckets.items()}
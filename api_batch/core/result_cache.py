@@ -0,0 +1,104 @@
+import hashlib
+import os
+import shutil
+from datetime import datetime, timedelta
+
+from orm.base import session_scope
+from orm.video_result import VideoResult
+
+__all__ = ['ResultCache', 'file_checksum']
+
+CACHE_POLICIES = ('always', 'never', 'max-age')
+
+
+def file_checksum(path, chunk_size=1024 * 1024):
+    """分块计算文件的sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    已生成视频的结果缓存
+
+    - 按任务内容指纹记录生成的视频文件及其sha256，记录在 video_results 表中，跨批次复用
+    - 命中时把已有视频硬链接(跨文件系统时复制)到本次的输出路径，不再调用生成接口
+    - 文件已被删除或内容与校验和不一致的记录视为未命中
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def check_policy(policy, max_age=None):
+        if policy not in CACHE_POLICIES:
+            raise ValueError(f"未知的缓存策略: {policy}，可选 {', '.join(CACHE_POLICIES)}")
+        if policy == 'max-age' and not max_age:
+            raise ValueError("缓存策略为 max-age 时必须指定 max_age(秒)")
+
+    def lookup(self, fingerprint, policy='always', max_age=None):
+        """返回可复用的 VideoResult 记录，策略不允许或未命中时返回None"""
+        if policy == 'never' or not fingerprint:
+            return None
+        with session_scope() as db:
+            query = db.query(VideoResult).filter(VideoResult.fingerprint == fingerprint)
+            if policy == 'max-age':
+                query = query.filter(VideoResult.created_at >= datetime.now() - timedelta(seconds=max_age))
+            result = query.first()
+            if result is not None:
+                db.expunge(result)
+
+        if result is None or not self._valid(result):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    @staticmethod
+    def _valid(result):
+        path = result.output_file
+        if not path or not os.path.exists(path) or os.path.getsize(path) != result.bytes:
+            return False
+        return file_checksum(path) == result.checksum
+
+    @staticmethod
+    def materialize(result, output_path):
+        """把缓存的视频放到 output_path，优先使用硬链接"""
+        source = result.output_file
+        if os.path.exists(output_path):
+            if os.path.samefile(source, output_path):
+                return output_path
+            os.remove(output_path)
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        try:
+            os.link(source, output_path)
+        except OSError:
+            tmp_path = f"{output_path}.part"
+            shutil.copy2(source, tmp_path)
+            os.replace(tmp_path, output_path)
+        return output_path
+
+    @staticmethod
+    def record(fingerprint, task_id, output_file):
+        """视频下载完成后记录结果，同一指纹以最新生成的视频为准"""
+        if not fingerprint or not os.path.exists(output_file):
+            return
+        checksum = file_checksum(output_file)
+        size = os.path.getsize(output_file)
+        with session_scope() as db:
+            result = db.query(VideoResult).filter(VideoResult.fingerprint == fingerprint).first()
+            if result is None:
+                result = VideoResult(fingerprint=fingerprint)
+                db.add(result)
+            result.task_id = task_id
+            result.output_file = output_file
+            result.checksum = checksum
+            result.bytes = size
+            result.created_at = datetime.now()
+
+    def summary(self):
+        return f"结果缓存：命中 {self.hits} 个，未命中 {self.misses} 个"
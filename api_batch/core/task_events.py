@@ -0,0 +1,97 @@
+import statistics
+
+from sqlalchemy import select
+
+from orm.video_task import VideoTask
+from orm.video_task_event import VideoTaskEvent
+
+__all__ = ['latency_breakdown', 'format_latency_breakdown']
+
+# 服务端开始处理任务的状态
+STARTED_EVENTS = ('Preparing', 'Processing')
+PHASES = ('queue_wait', 'generation', 'download', 'total')
+PHASE_NAMES = {
+    'queue_wait': '服务端排队',
+    'generation': '生成',
+    'download': '下载',
+    'total': '端到端',
+}
+
+
+def _summarize(samples):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    p90 = statistics.quantiles(samples, n=10)[-1] if len(samples) > 1 else samples[0]
+    return {'count': len(samples), 'median': statistics.median(samples), 'p90': p90, 'max': samples[-1]}
+
+
+def _phases(events):
+    """由单个任务按时间排序的 (事件, 时间) 计算各阶段耗时(秒)，未观察到的阶段不计"""
+    first = {}
+    last = {}
+    for event, created_at in events:
+        first.setdefault(event, created_at)
+        last[event] = created_at
+
+    submitted = first.get('Submitted')
+    started = min((first[event] for event in STARTED_EVENTS if event in first), default=None)
+    finished = first.get('Success')
+    phases = {}
+    if submitted and started:
+        phases['queue_wait'] = (started - submitted).total_seconds()
+    if started and finished:
+        phases['generation'] = (finished - started).total_seconds()
+    if 'DownloadStarted' in last and 'DownloadFinished' in last:
+        phases['download'] = (last['DownloadFinished'] - last['DownloadStarted']).total_seconds()
+    if submitted and 'DownloadFinished' in last:
+        phases['total'] = (last['DownloadFinished'] - submitted).total_seconds()
+    return phases
+
+
+def latency_breakdown(db, since=None, model=None):
+    """
+    按模型统计 服务端排队 / 生成 / 下载 / 端到端 各阶段耗时
+
+    - 排队：提交 -> 首次观察到 Preparing/Processing
+    - 生成：开始处理 -> 首次观察到 Success
+    - 下载：最后一次开始下载 -> 下载完成
+    事件时间为轮询观察到的时间，精度受查询间隔影响。
+    返回 {模型: {'tasks': 任务数, 阶段: {'count', 'median', 'p90', 'max'} 或None}}
+    """
+    query = (select(VideoTaskEvent.task_id, VideoTaskEvent.event, VideoTaskEvent.created_at, VideoTask.model)
+             .join(VideoTask, VideoTask.task_id == VideoTaskEvent.task_id)
+             .order_by(VideoTaskEvent.task_id, VideoTaskEvent.created_at, VideoTaskEvent.id))
+    if since is not None:
+        query = query.where(VideoTaskEvent.created_at >= since)
+    if model is not None:
+        query = query.where(VideoTask.model == model)
+
+    tasks = {}
+    for task_id, event, created_at, task_model in db.execute(query):
+        tasks.setdefault((task_model, task_id), []).append((event, created_at))
+
+    samples = {}
+    for (task_model, _), events in tasks.items():
+        model_samples = samples.setdefault(task_model, {'tasks': 0, **{phase: [] for phase in PHASES}})
+        model_samples['tasks'] += 1
+        for phase, seconds in _phases(events).items():
+            model_samples[phase].append(seconds)
+
+    return {task_model: {'tasks': values['tasks'], **{phase: _summarize(values[phase]) for phase in PHASES}}
+            for task_model, values in samples.items()}
+
+
+def format_latency_breakdown(breakdown):
+    """把 latency_breakdown 的结果格式化为便于阅读的文本"""
+    lines = []
+    for task_model, values in sorted(breakdown.items(), key=lambda item: str(item[0])):
+        lines.append(f"{task_model}（{values['tasks']} 个任务）")
+        for phase in PHASES:
+            stats = values[phase]
+            if stats is None:
+                lines.append(f"  {PHASE_NAMES[phase]}: 无数据")
+            else:
+                lines.append(f"  {PHASE_NAMES[phase]}: 中位数 {stats['median']:.1f}s，"
+                             f"P90 {stats['p90']:.1f}s，最长 {stats['max']:.1f}s（{stats['count']} 个）")
+    return '\n'.join(lines)
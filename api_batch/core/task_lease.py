@@ -0,0 +1,104 @@
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select, update
+
+from orm.base import session_scope
+from orm.video_task import TERMINAL_STATUSES, VideoTask
+from .log import get_logger
+
+__all__ = ['TaskLease']
+
+logger = get_logger('task_lease')
+
+
+class TaskLease:
+    """
+    worker模式下基于租约的任务认领
+
+    - 多个进程(可在不同主机上，共用同一个数据库)通过一条带条件的 UPDATE 认领未结束且无人持有
+      或租约已过期的任务，同一任务同一时刻只会被一个worker持有
+    - 后台线程每 lease_seconds / 3 秒为本worker持有的未结束任务续约
+    - worker崩溃后停止续约，租约过期的任务由其他worker接手；正常退出时主动释放未完成的任务
+    """
+
+    def __init__(self, worker_id=None, lease_seconds=60, terminal_statuses=TERMINAL_STATUSES):
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease_seconds = lease_seconds
+        self.terminal_statuses = tuple(terminal_statuses)
+        self._claimed_ids = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _open(self):
+        """可由worker处理的任务：排队中，或已提交但未结束"""
+        return and_(VideoTask.status.notin_(self.terminal_statuses),
+                    or_(VideoTask.status == 'Queued',
+                        and_(VideoTask.task_id.isnot(None), VideoTask.task_id != '')))
+
+    def _claimable(self, now):
+        return and_(self._open(), or_(VideoTask.claimed_by.is_(None), VideoTask.lease_expires < now))
+
+    def claim(self, limit):
+        """认领最多 limit 个任务，返回新认领到的记录(已从会话分离)"""
+        now = datetime.now()
+        candidates = (select(VideoTask.id)
+                      .where(self._claimable(now))
+                      .order_by(VideoTask.id)
+                      .limit(limit)
+                      .scalar_subquery())
+        with session_scope() as db:
+            # 条件在UPDATE中再判断一次，并发认领同一行时只有一个worker能成功
+            db.execute(update(VideoTask)
+                       .where(VideoTask.id.in_(candidates), self._claimable(now))
+                       .values(claimed_by=self.worker_id,
+                               lease_expires=now + timedelta(seconds=self.lease_seconds))
+                       .execution_options(synchronize_session=False))
+            query = db.query(VideoTask).filter(VideoTask.claimed_by == self.worker_id, self._open())
+            if self._claimed_ids:
+                query = query.filter(VideoTask.id.notin_(self._claimed_ids))
+            rows = query.order_by(VideoTask.id).all()
+            db.expunge_all()
+        self._claimed_ids.update(row.id for row in rows)
+        return rows
+
+    def has_open_tasks(self):
+        """是否还有其他worker持有或尚未被认领的未结束任务"""
+        with session_scope() as db:
+            query = db.query(VideoTask.id).filter(self._open(),
+                                                  or_(VideoTask.claimed_by.is_(None),
+                                                      VideoTask.claimed_by != self.worker_id))
+            return query.first() is not None
+
+    def renew(self):
+        """为本worker持有的未结束任务续约"""
+        with session_scope() as db:
+            db.execute(update(VideoTask)
+                       .where(VideoTask.claimed_by == self.worker_id, self._open())
+                       .values(lease_expires=datetime.now() + timedelta(seconds=self.lease_seconds))
+                       .execution_options(synchronize_session=False))
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self.renew()
+            except Exception as e:
+                logger.error("worker %s 续约出错: %s", self.worker_id, e)
+
+    def release(self):
+        """停止续约并释放本worker持有的未完成任务，供其他worker立即接手"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        with session_scope() as db:
+            db.execute(update(VideoTask)
+                       .where(VideoTask.claimed_by == self.worker_id, self._open())
+                       .values(claimed_by=None, lease_expires=None)
+                       .execution_options(synchronize_session=False))
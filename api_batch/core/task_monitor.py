@@ -0,0 +1,83 @@
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import func, select
+
+from orm.video_task import COMPLETED_STATUSES, FAILED_STATUSES, SETTLED_STATUSES, VideoTask
+
+__all__ = ['task_filters', 'list_tasks', 'status_summary', 'task_options', 'pollable_tasks', 'downloadable_tasks']
+
+# 任务列表返回的字段
+TASK_COLUMNS = (VideoTask.id, VideoTask.task_id, VideoTask.model, VideoTask.status, VideoTask.prompt,
+                VideoTask.submit_time, VideoTask.complete_time, VideoTask.video_url, VideoTask.output_file,
+                VideoTask.api_key_id, VideoTask.batch_id)
+
+
+def task_filters(statuses=None, models=None, date_from=None, date_to=None, batch_id=None):
+    """
+    任务列表的筛选条件，在数据库中完成筛选
+
+    - statuses / models: 状态、模型的取值列表，为空时不筛选
+    - date_from / date_to: 提交日期范围(date，含两端)
+    """
+    conditions = []
+    if statuses:
+        conditions.append(VideoTask.status.in_(list(statuses)))
+    if models:
+        conditions.append(VideoTask.model.in_(list(models)))
+    if date_from:
+        conditions.append(VideoTask.submit_time >= datetime.combine(date_from, time.min))
+    if date_to:
+        conditions.append(VideoTask.submit_time < datetime.combine(date_to + timedelta(days=1), time.min))
+    if batch_id:
+        conditions.append(VideoTask.batch_id == batch_id)
+    return conditions
+
+
+def list_tasks(db, conditions=(), page=1, page_size=50):
+    """按提交时间倒序分页读取任务，返回 (本页任务字典列表, 总数)"""
+    total = db.execute(select(func.count()).select_from(VideoTask).where(*conditions)).scalar()
+    query = (select(*TASK_COLUMNS)
+             .where(*conditions)
+             .order_by(VideoTask.submit_time.desc(), VideoTask.id.desc())
+             .offset(max(page - 1, 0) * page_size)
+             .limit(page_size))
+    return [dict(row._mapping) for row in db.execute(query)], total
+
+
+def status_summary(db, conditions=()):
+    """用SQL聚合统计各状态的任务数，返回 {'total', 'completed', 'failed', 'pending', 'statuses': {状态: 数量}}"""
+    query = select(VideoTask.status, func.count()).where(*conditions).group_by(VideoTask.status)
+    statuses = {status: count for status, count in db.execute(query)}
+    total = sum(statuses.values())
+    completed = sum(statuses.get(status, 0) for status in COMPLETED_STATUSES)
+    failed = sum(statuses.get(status, 0) for status in FAILED_STATUSES)
+    return {'total': total, 'completed': completed, 'failed': failed, 'pending': total - completed - failed,
+            'statuses': statuses}
+
+
+def task_options(db):
+    """筛选控件的可选项：已有的状态和模型"""
+    statuses = [status for (status,) in db.execute(select(VideoTask.status).distinct()) if status]
+    models = [model for (model,) in db.execute(select(VideoTask.model).distinct()) if model]
+    return sorted(statuses), sorted(models)
+
+
+def pollable_tasks(db, limit=None):
+    """需要向接口查询状态的任务：已有任务ID且接口侧尚未结束，返回 {task_id: 密钥ID}"""
+    query = (select(VideoTask.task_id, VideoTask.api_key_id)
+             .where(VideoTask.task_id.isnot(None),
+                    VideoTask.task_id != '',
+                    VideoTask.status.notin_(SETTLED_STATUSES))
+             .order_by(VideoTask.submit_time.desc()))
+    if limit:
+        query = query.limit(limit)
+    return {task_id: api_key_id for task_id, api_key_id in db.execute(query)}
+
+
+def downloadable_tasks(db, limit=200):
+    """已生成、有文件ID的任务，按提交时间倒序"""
+    query = (select(VideoTask.task_id, VideoTask.video_url, VideoTask.output_file, VideoTask.api_key_id)
+             .where(VideoTask.status.in_(COMPLETED_STATUSES), VideoTask.video_url.isnot(None))
+             .order_by(VideoTask.submit_time.desc())
+             .limit(limit))
+    return [dict(row._mapping) for row in db.execute(query)]
@@ -0,0 +1,165 @@
+import functools
+import json
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .log import get_logger
+
+__all__ = ['Tracer', 'span', 'start_tracing', 'stop_tracing', 'traced']
+
+logger = get_logger('tracing')
+
+# 当前生效的追踪器，为None时所有埋点直接跳过
+_tracer = None
+
+
+class _NullSpan:
+    """关闭追踪时使用的空上下文，不做任何记录"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'category', 'args', 'started')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.record(self.name, self.category, self.started, time.perf_counter(), self.args)
+        return False
+
+
+class Tracer:
+    """
+    以Chrome trace-event格式记录耗时区间，输出的JSON可直接用 Perfetto / chrome://tracing 打开
+
+    每个区间记录为一条 ph=X 的完整事件，按线程分行显示
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self._events = []
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def span(self, name, category='engine', **args):
+        return _Span(self, name, category, args)
+
+    def record(self, name, category, started, finished, args):
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (started - self.origin) * 1e6,
+            'dur': (finished - started) * 1e6,
+            'pid': self.pid,
+            'tid': thread.ident,
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self._events.append(event)
+            self._threads.setdefault(thread.ident, thread.name)
+
+    def save(self):
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+                    for tid, name in threads.items()]
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+        logger.info("追踪文件已保存至: %s（%d 个区间）", self.path, len(events))
+
+
+def _before_commit(session):
+    session.info['trace_commit_started'] = time.perf_counter()
+
+
+def _after_commit(session):
+    started = session.info.pop('trace_commit_started', None)
+    tracer = _tracer
+    if tracer is not None and started is not None:
+        tracer.record('db.commit', 'db', started, time.perf_counter(), None)
+
+
+def _after_rollback(session):
+    session.info.pop('trace_commit_started', None)
+
+
+# 数据库提交通过会话事件记录(含提交前的flush)，只在开启追踪期间挂载，关闭时没有额外开销
+_SESSION_HOOKS = (('before_commit', _before_commit), ('after_commit', _after_commit),
+                  ('after_rollback', _after_rollback))
+
+
+def start_tracing(path):
+    """开启追踪，之后的埋点区间和数据库提交都记录到 path"""
+    global _tracer
+    _tracer = Tracer(path)
+    for name, hook in _SESSION_HOOKS:
+        if not event.contains(Session, name, hook):
+            event.listen(Session, name, hook)
+    return _tracer
+
+
+def stop_tracing():
+    """关闭追踪并写出追踪文件"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    for name, hook in _SESSION_HOOKS:
+        if event.contains(Session, name, hook):
+            event.remove(Session, name, hook)
+    if tracer is not None:
+        tracer.save()
+    return tracer
+
+
+def span(name, category='engine', **args):
+    """记录代码块耗时的上下文管理器；未开启追踪时返回空上下文"""
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.span(name, category, **args)
+
+
+def traced(name=None, category='engine'):
+    """记录函数调用耗时的装饰器；未开启追踪时只多一次全局变量判断"""
+
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return fn(*args, **kwargs)
+            with tracer.span(span_name, category):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,92 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .log import get_logger
+
+__all__ = ['HttpTransport']
+
+logger = get_logger('transport')
+
+
+class HttpTransport:
+    """
+    MiniMax接口共享的HTTP传输层
+
+    - 所有线程共用同一个连接池(HTTPAdapter)，保持长连接，避免每次请求重新TLS握手
+    - 每个线程持有自己的Session（Session本身的cookie等状态不是线程安全的）
+    - 按阶段(submit/query/retrieve/download/upload)设置(连接超时, 读取超时)
+    - 5xx和连接错误按带抖动的指数退避重试
+    """
+
+    DEFAULT_TIMEOUTS = {
+        'submit': (5, 60),
+        'query': (5, 15),
+        'retrieve': (5, 15),
+        'download': (5, 120),
+        'upload': (5, 120),
+    }
+    RETRY_STATUS = (500, 502, 503, 504)
+    # 非幂等请求(提交任务)只在确定未被服务端处理时重试，避免重复计费
+    NON_IDEMPOTENT_RETRY_STATUS = (502, 503)
+
+    def __init__(self, pool_size=10, timeouts=None, max_retries=3, backoff_base=0.5, backoff_max=30):
+        self.pool_size = pool_size
+        self.timeouts = dict(self.DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        """当前线程的Session，挂载共享的连接池"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', self.adapter)
+            session.mount('http://', self.adapter)
+            self._local.session = session
+        return session
+
+    def request(self, method, url, stage, **kwargs):
+        """发送请求，stage决定超时设置；重试耗尽后返回最后一次响应或抛出最后一次异常"""
+        kwargs.setdefault('timeout', self.timeouts.get(stage))
+        idempotent = method.upper() in ('GET', 'HEAD', 'OPTIONS')
+        retry_status = self.RETRY_STATUS if idempotent else self.NON_IDEMPOTENT_RETRY_STATUS
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt >= self.max_retries
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # 非幂等请求只有在连接阶段失败时才能确定请求未送达
+                retryable = idempotent or isinstance(e, requests.ConnectTimeout)
+                if last_attempt or not retryable:
+                    raise
+                logger.warning("[%s] 请求出错，第 %d 次重试: %s", stage, attempt + 1, e)
+            else:
+                if last_attempt or response.status_code not in retry_status:
+                    return response
+                logger.warning("[%s] 服务端返回 %s，第 %d 次重试", stage, response.status_code, attempt + 1)
+                response.close()
+            time.sleep(self.backoff(attempt))
+
+    def backoff(self, attempt):
+        """带完全抖动(full jitter)的指数退避时长"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def get(self, url, stage, **kwargs):
+        return self.request('GET', url, stage, **kwargs)
+
+    def post(self, url, stage, **kwargs):
+        return self.request('POST', url, stage, **kwargs)
+
+    def close(self):
+        """关闭连接池"""
+        self.adapter.close()
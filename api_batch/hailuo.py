@@ -1,41 +1,145 @@
 from datetime import datetime
 
-import requests
 import json
 import time
 import os
 import base64
 import argparse
+import asyncio
+import itertools
+import threading
 import concurrent.futures
+from dotenv import load_dotenv
 from tqdm import tqdm
-from orm.video_task import VideoTask
-from orm.base import init_db, SessionLocal
+from orm.video_task import SETTLED_STATUSES, TERMINAL_STATUSES, VideoTask
+from orm.base import configure as configure_db, init_db, session_scope
+from orm.writer import TaskStateWriter
+from core.pipeline import BatchPipeline
+from core.transport import HttpTransport
+from core.downloader import stream_download, DownloadPool
+from core.image_cache import EncodedImageCache
+from core.image_preflight import ImagePreflight
+from core.file_uploader import ReferenceImageUploader
+from core.fingerprint import task_fingerprint
+from core.result_cache import ResultCache
+from core.key_pool import KeyPool
+from core.metrics import BatchMetrics, MetricsDumper, MetricsServer
+from core.task_events import format_latency_breakdown, latency_breakdown
+from core.task_lease import TaskLease
+from core.tracing import span, start_tracing, stop_tracing, traced
+from core.log import get_logger, setup_logging
+from core.poll_scheduler import PollScheduler, learn_expected_times
+
+logger = get_logger('batch')
 
 max_workers = 1
 
 
+def status_code(result):
+    """接口返回结果中的 base_resp.status_code，没有时返回None"""
+    if not isinstance(result, dict):
+        return None
+    return (result.get('base_resp') or {}).get('status_code')
+
+
 class MiniMaxVideoBatchGenerator:
-    def __init__(self, api_key, base_url="https://api.minimaxi.com"):
-        self.api_key = api_key
+    def __init__(self, api_key, base_url="https://api.minimaxi.com", pool_size=10, timeouts=None,
+                 max_retries=3, rate_limits=None, rate_limit_retries=5, image_cache_bytes=256 * 1024 * 1024,
+                 preflight=None, upload_images=False, dedup=True, metrics=None):
+        """
+        参数:
+        - api_key: API密钥；多个密钥时传入密钥列表或 KeyPool，提交按各密钥的速率和余额分配
+        - pool_size: HTTP连接池大小
+        - timeouts: 各阶段超时设置，如 {'query': (5, 15)}，未指定的阶段使用默认值
+        - max_retries: 5xx和连接错误的最大重试次数
+        - rate_limits: 每个密钥 submit/query/retrieve 的限速配置，如 {'submit': (1, 5)} 表示每秒1次、突发5次
+        - rate_limit_retries: 接口返回限流状态码后的最大重试次数
+        - image_cache_bytes: 图片编码缓存的内存上限(字节)
+        - preflight: 图片预处理参数，如 {'quality': 85, 'max_side': 1280}；为False时按原图提交
+        - upload_images: 为True时参考图通过文件接口上传一次，之后的任务复用file_id，不再内联base64
+        - dedup: 为True时按任务内容指纹去重，已提交过(未失败)的相同任务不再重复提交，而是接回原任务
+        - metrics: 指标收集对象 BatchMetrics，为None时新建；可交给 MetricsServer / MetricsDumper 导出
+        """
+        if isinstance(api_key, KeyPool):
+            self.key_pool = api_key
+        else:
+            self.key_pool = KeyPool([api_key] if isinstance(api_key, str) else api_key, rate_limits)
+        self.api_key = self.key_pool.default.key
         self.base_url = base_url
-        self.headers = {
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json'
-        }
+        self.headers = self.key_pool.default.headers
+        self.transport = HttpTransport(pool_size=pool_size, timeouts=timeouts, max_retries=max_retries)
+        self.rate_limiter = self.key_pool.default.limiter
+        self.rate_limit_retries = rate_limit_retries
+        self.image_cache = EncodedImageCache(image_cache_bytes)
+        self.preflight = ImagePreflight(**(preflight or {})) if preflight is not False else None
+        self.uploader = ReferenceImageUploader(self) if upload_images else None
+        self.dedup = dedup
+        self.result_cache = ResultCache()
+        self.metrics = metrics or BatchMetrics()
+        # 本进程内已认领的任务指纹 -> 任务信息(提交中为None)，防止同一批次或界面重复运行时重复提交
+        self._claimed = {}
+        self._claim_lock = threading.Lock()
         # 初始化数据库
         init_db()
 
-        # 写入数据库
-        self.db = SessionLocal()
+        # 所有阶段的数据库写入都交给单一写线程，读取使用各自的短生命周期会话
+        self.writer = TaskStateWriter()
 
-    def encode_image(self, image_path):
-        """将图片编码为base64格式"""
-        with open(image_path, 'rb') as img_file:
-            return base64.b64encode(img_file.read()).decode('utf-8')
+    def _call_api(self, kind, method, url, key_id=None, rate_limit_retries=None, **kwargs):
+        """
+        经限流器调用MiniMax接口并返回解析后的JSON
+
+        kind 为 submit / query / retrieve / upload，同时决定限速桶和超时设置；
+        key_id 指定使用密钥池中的哪个密钥，为None时使用默认密钥；
+        返回限流状态码时请求未被受理，降速后重试
+        """
+        api_key = self.key_pool.get(key_id)
+        headers = kwargs.pop('headers', api_key.headers)
+        if rate_limit_retries is None:
+            rate_limit_retries = self.rate_limit_retries
+        for attempt in range(rate_limit_retries + 1):
+            with span('rate_limit', kind=kind):
+                api_key.limiter.acquire(kind)
+            started = time.perf_counter()
+            try:
+                with span(f"http.{kind}", 'http', attempt=attempt):
+                    response = self.transport.request(method, url, kind, headers=headers, **kwargs)
+                    result = response.json()
+            except Exception:
+                self.metrics.api_calls.inc(kind=kind, code='error')
+                raise
+            finally:
+                self.metrics.api_latency.observe(time.perf_counter() - started, kind=kind)
+            code = status_code(result)
+            self.metrics.api_calls.inc(kind=kind, code=response.status_code if code is None else code)
+            if not api_key.limiter.observe(kind, result) or attempt >= rate_limit_retries:
+                return result
+
+    def encode_image(self, data, model=None):
+        """将图片内容编码为data URI；启用预处理时先按模型要求缩放、压缩"""
+        with span('encode_image', bytes=len(data), model=model):
+            if self.preflight is None:
+                return f"data:image/jpeg;base64,{base64.b64encode(data).decode('utf-8')}"
+            processed, mime = self.preflight.process(data, model)
+            return f"data:{mime};base64,{base64.b64encode(processed).decode('utf-8')}"
 
+    def image_data_uri(self, image_path, model=None):
+        """将本地图片转为data URI，相同内容的图片在缓存中只编码一次"""
+        variant = self.preflight.settings_key(model) if self.preflight is not None else ''
+        return self.image_cache.get(image_path, lambda data: self.encode_image(data, model), variant=variant)
+
+    def image_reference(self, image, model=None):
+        """本地图片转为data URI(启用上传时为已上传文件的URL)，其他情况视为URL原样返回"""
+        if os.path.exists(image):
+            if self.uploader is not None:
+                return self.uploader.reference(image, model)
+            return self.image_data_uri(image, model)
+        return image
+
+    @traced()
     def create_video_task(self, model, prompt="", first_frame_image=None,
-                          prompt_optimizer=True, subject_reference=None):
-        """创建视频生成任务"""
+                          prompt_optimizer=True, subject_reference=None, key_id=None, rate_limit_retries=None):
+        """创建视频生成任务，key_id 指定提交使用的密钥"""
         url = f"{self.base_url}/v1/video_generation"
 
         payload = {
@@ -46,217 +150,728 @@ class MiniMaxVideoBatchGenerator:
 
         # 添加首帧图片（如果提供）
         if first_frame_image:
-            if os.path.exists(first_frame_image):
-                image_base64 = self.encode_image(first_frame_image)
-                payload["firstFrameImage"] = f"data:image/jpeg;base64,{image_base64}"
-            else:
-                # 假设提供的是URL
-                payload["firstFrameImage"] = first_frame_image
+            payload["firstFrameImage"] = self.image_reference(first_frame_image, model)
 
         # 添加主体参考（如果提供且模型是S2V-01）
         if subject_reference and model == "S2V-01":
             if isinstance(subject_reference, list):
-                payload["subjectReference"] = subject_reference
+                payload["subjectReference"] = [self.image_reference(image, model) for image in subject_reference]
             else:
                 # 单个主体参考图片
-                if os.path.exists(subject_reference):
-                    image_base64 = self.encode_image(subject_reference)
-                    payload["subjectReference"] = [f"data:image/jpeg;base64,{image_base64}"]
-                else:
-                    # 假设提供的是URL
-                    payload["subjectReference"] = [subject_reference]
-
-        response = requests.post(url, headers=self.headers, json=payload)
-        print(f"任务提交后返回的结果：{response.json()}")
+                payload["subjectReference"] = [self.image_reference(subject_reference, model)]
+
+        result = self._call_api('submit', 'POST', url, key_id=key_id,
+                                rate_limit_retries=rate_limit_retries, json=payload)
+        logger.debug("任务提交后返回的结果: %s", result)
         # 判断task_id 为空则提示异常
         # {'task_id': '', 'base_resp': {'status_code': 1008, 'status_msg': 'insufficient balance'}}
-        return response.json()
+        return result
 
-    def check_task_status(self, task_id):
+    @traced()
+    def check_task_status(self, task_id, key_id=None):
 
         if task_id != "" or task_id is not None:
-            """检查任务状态"""
+            """检查任务状态，须使用提交该任务的密钥"""
             url = f"{self.base_url}/v1/query/video_generation?task_id={task_id}"
-            print(self.headers,url)
-            response = requests.get(url, headers=self.headers)
-            print(f"任务状态查询结果：{response.json()}")
-            return response.json()
+            result = self._call_api('query', 'GET', url, key_id=key_id)
+            logger.debug("任务 %s 状态查询结果: %s", task_id, result)
+            return result
         else:
             return {"task_id": "", "base_resp": {"status_code": 1008, "status_msg": "task_id为空，麻烦检查费用"}}
 
-    def download_video(self, file_id, output_path):
-        print("---------------视频生成成功，下载中---------------")
-        url = "https://api.minimaxi.com/v1/files/retrieve?file_id="+file_id
+    def retrieve_file(self, file_id, key_id=None):
+        """查询文件信息，返回结果中 file.download_url 为下载链接"""
+        url = f"{self.base_url}/v1/files/retrieve?file_id={file_id}"
+        return self._call_api('retrieve', 'GET', url, key_id=key_id)
 
+    def upload_file(self, data, file_name, mime, purpose="video_generation"):
+        """通过文件接口上传文件，返回结果中 file.file_id 为文件ID"""
+        url = f"{self.base_url}/v1/files/upload"
+        # multipart请求由requests生成Content-Type，不能沿用JSON请求头
+        headers = {'Authorization': self.headers['Authorization']}
+        return self._call_api('upload', 'POST', url, headers=headers,
+                              data={'purpose': purpose}, files={'file': (file_name, data, mime)})
 
-        response = requests.request("GET", url, headers=self.headers)
-        print(response.text)
+    @traced()
+    def download_video(self, file_id, output_path, key_id=None):
+        result = self.retrieve_file(file_id, key_id)
+        logger.debug("文件 %s 查询结果: %s", file_id, result)
 
-        download_url = response.json()['file']['download_url']
-        print("视频下载链接：" + download_url)
-        with open(output_path, 'wb') as f:
-            f.write(requests.get(download_url).content)
-        print("已下载在："+os.getcwd()+'/'+output_path)
+        download_url = result['file']['download_url']
+        size = stream_download(self.transport, download_url, output_path)
+        logger.info("视频已下载至: %s (%d 字节)", os.path.abspath(output_path), size)
         return output_path
 
-    def process_batch(self, tasks, output_dir="output", max_workers=3, check_interval=5):
+    def process_batch(self, tasks, output_dir="output", max_workers=3, check_interval=5, max_check_interval=60,
+                      download_workers=3, max_in_flight=None, cache_policy='always', cache_max_age=None,
+                      batch_id=None):
         """
         批量处理视频生成任务
         
         参数:
-        - tasks: 任务列表，每个任务是包含model、prompt、first_frame_image等参数的字典
+        - tasks: 任务列表或任务生成器，每个任务是包含model、prompt、first_frame_image等参数的字典；按需逐个读取
         - output_dir: 输出目录
         - max_workers: 最大并行任务数
-        - check_interval: 检查任务状态的时间间隔（秒）
+        - check_interval: 检查任务状态的最小时间间隔（秒），任务未完成时间隔按指数退避增长
+        - max_check_interval: 检查任务状态的最大时间间隔（秒）
+        - download_workers: 并行下载数，下载在独立线程池中进行，不阻塞状态轮询
+        - max_in_flight: 同时在服务端排队/生成的最大任务数，有任务结束才提交新任务；为None时一次提交全部任务
+        - cache_policy: 结果缓存策略，always 总是复用已生成的相同视频，never 总是重新生成，
+          max-age 只复用 cache_max_age 秒内生成的视频
+        - batch_id: 批次标识，写入任务记录，用于按批次统计进度
         """
+        self.result_cache.check_policy(cache_policy, cache_max_age)
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        # 提交所有任务
-        task_ids = []
         task_info = []
+        task_iter = iter(tasks)
+        seq = itertools.count(1)
 
-        print(f"提交 {len(tasks)} 个视频生成任务...")
+        logger.info("开始提交视频生成任务...")
 
         with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 将所有任务提交到线程池
-            future_to_task = {executor.submit(self.create_video_task,
-                                              task.get('model'),
-                                              task.get('prompt'),
-                                              task.get('first_frame_image'),
-                                              task.get('prompt_optimizer'),
-                                              task.get('subject_reference')): task for i, task in enumerate(tasks)}
-
-            # 处理完成的任务
-            for i, future in enumerate(concurrent.futures.as_completed(future_to_task)):
-                original_task = future_to_task[future]
+            def admit(in_flight):
+                """按在途窗口从任务源读取并提交新任务，返回提交成功的任务；任务源已读完时返回None"""
+                capacity = None if max_in_flight is None else max_in_flight - in_flight
+                if capacity is not None and capacity <= 0:
+                    return []
+                batch = list(itertools.islice(task_iter, capacity))
+                if not batch:
+                    return None
+                futures = [executor.submit(self.submit_task, original_task, next(seq), output_dir,
+                                           cache_policy, cache_max_age, batch_id)
+                           for original_task in batch]
+                submitted = [future.result() for future in futures]
+                task_info.extend(submitted)
+                return [task for task in submitted if self.needs_tracking(task)]
+
+            # 跟踪所有任务的完成情况
+            self._track_tasks([], check_interval, max_check_interval, download_workers, admit=admit)
+
+        logger.info("总提交任务数: %d", len(task_info))
+        self.write_report(task_info, output_dir)
+        return task_info
+
+    def submit_task(self, original_task, index, output_dir, cache_policy='always', cache_max_age=None,
+                    batch_id=None):
+        """
+        提交单个任务并写入数据库，返回任务信息；提交失败时 task_id 为None
+
+        - 结果缓存中有相同任务生成的视频时(按 cache_policy)，直接复用该视频并返回 Completed，不调用接口
+        - 开启去重时，内容指纹相同且仍在生成中的任务不会重复提交：
+          本进程内已提交过的返回状态为 Duplicate 的任务信息，数据库中已有记录的接回原任务，
+          已由 enqueue 排队等待worker提交的同样返回 Duplicate
+        """
+        fingerprint = None
+        if self.dedup or cache_policy != 'never':
+            try:
+                fingerprint = task_fingerprint(original_task, self.image_cache.content_hash)
+            except OSError as e:
+                logger.warning("任务 %s 计算指纹出错，不做去重: %s", index, e)
+
+        task = self._reuse_cached(fingerprint, index, output_dir, cache_policy, cache_max_age, original_task)
+        if task is not None:
+            task['batch_id'] = batch_id
+            self.save_task_record(task)
+            return task
+
+        if self.dedup and fingerprint:
+            existing = self._claim(fingerprint, original_task, index, output_dir, batch_id)
+            if existing is not None:
+                return existing
+
+        task = self._create(original_task, index, output_dir)
+        task['batch_id'] = batch_id
+        if task['task_id']:
+            # 下载完成后按指纹记录结果缓存
+            task['fingerprint'] = fingerprint
+        if self.dedup and fingerprint:
+            if task['task_id']:
+                with self._claim_lock:
+                    self._claimed[fingerprint] = task
+            else:
+                # 提交失败的任务允许下次重新提交
+                with self._claim_lock:
+                    self._claimed.pop(fingerprint, None)
+        if not task['task_id']:
+            self.metrics.tasks.inc(status=task['status'])
+
+        self.save_task_record(task)
+        self.record_event(task['task_id'], 'Submitted')
+        return task
+
+    def _reuse_cached(self, fingerprint, index, output_dir, cache_policy, cache_max_age, original_task):
+        """结果缓存中有相同任务生成的视频时复制到输出目录，返回状态为 Completed 的任务信息；未命中返回None"""
+        cached = self.result_cache.lookup(fingerprint, cache_policy, cache_max_age)
+        if cached is None:
+            return None
+        output_file = os.path.join(output_dir, f"video_{index}_{cached.task_id}.mp4")
+        try:
+            self.result_cache.materialize(cached, output_file)
+        except OSError as e:
+            logger.warning("任务 %s 复用已生成的视频出错，重新生成: %s", index, e)
+            return None
+        logger.info("任务 %s 命中结果缓存，复用视频: %s", index, cached.output_file)
+        self.metrics.tasks.inc(status='Cached')
+        return {
+            'task_id': None,
+            'status': 'Completed',
+            'video_url': None,
+            'output_file': output_file,
+            'cached_from': cached.task_id,
+            'original_task': original_task
+        }
+
+    def _claim(self, fingerprint, original_task, index, output_dir, batch_id=None):
+        """认领任务指纹；已有相同任务时返回其任务信息，否则返回None表示需要提交；接回的任务计入 batch_id 批次"""
+        with self._claim_lock:
+            claimed = self._claimed.get(fingerprint)
+            if claimed is not None and claimed.get('status') in SETTLED_STATUSES:
+                # 已结束(完成、失败或下载失败)的任务不再算作重复，按数据库记录和结果缓存决定是否重新提交
+                del self._claimed[fingerprint]
+            if fingerprint in self._claimed:
+                logger.info("任务 %s 与本次运行中已提交的任务重复，跳过", index)
+                self.metrics.tasks.inc(status='Duplicate')
+                return {
+                    'task_id': claimed['task_id'] if claimed else None,
+                    'status': 'Duplicate',
+                    'original_task': original_task
+                }
+            self._claimed[fingerprint] = None
+
+        with session_scope() as db:
+            row = db.query(VideoTask).filter(VideoTask.fingerprint == fingerprint).first()
+            queued = row is not None and row.status == 'Queued'
+            if row is not None and not queued and (row.status in TERMINAL_STATUSES or not row.task_id):
+                # 失败的记录释放指纹，重新提交；已完成的视频能否复用由结果缓存决定，到这里说明需要重新生成
+                row.fingerprint = None
+                row = None
+            if row is not None and not queued:
+                if batch_id:
+                    row.batch_id = batch_id
+                db.flush()
+                db.expunge(row)
+        if queued:
+            # enqueue 写入的排队记录由worker认领提交，这里提交会重复生成
+            logger.info("任务 %s 已在队列中等待worker提交，跳过", index)
+            with self._claim_lock:
+                self._claimed.pop(fingerprint, None)
+            self.metrics.tasks.inc(status='Duplicate')
+            return {'task_id': None, 'status': 'Duplicate', 'original_task': original_task}
+        if row is None:
+            return None
+
+        task = self._task_from_row(row, output_dir)
+        task['submitted_at'] = row.submit_time.timestamp() if row.submit_time else time.time()
+        logger.info("任务 %s 已提交过，接回任务ID: %s", index, row.task_id)
+        with self._claim_lock:
+            self._claimed[fingerprint] = task
+        return task
+
+    @staticmethod
+    def needs_tracking(task):
+        """提交阶段返回的任务是否需要轮询：新提交或接回的未结束任务，重复、已完成或失败的任务不需要"""
+        return bool(task.get('task_id')) and task.get('status') not in TERMINAL_STATUSES + ('Duplicate',)
+
+    def _submit_with_pool(self, original_task, index):
+        """
+        从密钥池选择密钥提交任务，返回 (接口结果, 密钥ID)
+
+        余额不足或触发限流的密钥暂时移出轮换，任务换一个密钥重试；
+        只有一个密钥时沿用限流后降速重试的逻辑
+        """
+        multiple = len(self.key_pool) > 1
+        attempts = len(self.key_pool) if multiple else 1
+        for attempt in range(attempts):
+            api_key = self.key_pool.choose()
+            response = self.create_video_task(original_task.get('model'),
+                                              original_task.get('prompt'),
+                                              original_task.get('first_frame_image'),
+                                              original_task.get('prompt_optimizer'),
+                                              original_task.get('subject_reference'),
+                                              key_id=api_key.id,
+                                              rate_limit_retries=0 if multiple else None)
+            if not self.key_pool.observe(api_key, response) or attempt + 1 >= attempts:
+                break
+            logger.warning("任务 %s 换用其他密钥重试", index)
+        return response, api_key.id
+
+    def _create(self, original_task, index, output_dir):
+        """调用接口创建任务，返回任务信息"""
+        try:
+            response, key_id = self._submit_with_pool(original_task, index)
+            task_id = response.get('task_id')
+            if task_id:
+                task = {
+                    'task_id': task_id,
+                    'status': 'Submitted',
+                    'submitted_at': time.time(),
+                    'api_key_id': key_id,
+                    'output_file': os.path.join(output_dir, f"video_{index}_{task_id}.mp4"),
+                    'original_task': original_task
+                }
+                logger.info("任务 %s 已提交，任务ID: %s", index, task_id)
+            else:
+                logger.error("任务 %s 提交失败: %s", index, response)
+                task = {
+                    'task_id': None,
+                    'status': 'Failed',
+                    'error': response,
+                    'original_task': original_task
+                }
+        except Exception as e:
+            logger.error("任务 %s 提交出错: %s", index, e)
+            task = {
+                'task_id': None,
+                'status': 'Error',
+                'error': str(e),
+                'original_task': original_task
+            }
+        return task
+
+    def resume(self, output_dir="output", check_interval=5, max_check_interval=60, download_workers=3):
+        """
+        恢复中断的批次
+
+        从数据库重新加载所有已提交但未结束的任务，接回状态轮询和下载流程：
+        - 输出文件已存在的任务直接标记为完成，不重复下载
+        - 已生成成功(Success)但未下载的任务直接进入下载
+        - 其余任务按原提交时间重新加入轮询调度
+        """
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        with session_scope() as db:
+            rows = (db.query(VideoTask)
+                    .filter(VideoTask.task_id.isnot(None),
+                            VideoTask.task_id != '',
+                            VideoTask.status.notin_(TERMINAL_STATUSES))
+                    .all())
+            db.expunge_all()
+        logger.info("找到 %d 个未完成的任务", len(rows))
+
+        task_info = []
+        pending_tasks = []
+        ready_tasks = []
+        for row in rows:
+            task = self._task_from_row(row, output_dir)
+            task_info.append(task)
+            if row.fingerprint:
+                with self._claim_lock:
+                    self._claimed[row.fingerprint] = task
+
+            if os.path.exists(task['output_file']):
+                self.mark_downloaded(task)
+                logger.info("任务 %s 的视频已存在，跳过", row.task_id)
+            elif row.status == 'Success' and row.video_url:
+                ready_tasks.append(task)
+            else:
+                pending_tasks.append(task)
+                if row.submit_time:
+                    task['submitted_at'] = row.submit_time.timestamp()
+
+        logger.info("待下载 %d 个，待查询状态 %d 个", len(ready_tasks), len(pending_tasks))
+        self._track_tasks(pending_tasks, check_interval, max_check_interval, download_workers,
+                          ready_tasks=ready_tasks)
+
+        self.write_report(task_info, output_dir)
+        return task_info
+
+    def enqueue(self, tasks):
+        """
+        把任务写入数据库排队(状态为 Queued)，由 run_worker 启动的worker认领并提交，返回入队数量
+
+        开启去重时，与排队中或生成中的任务内容相同的任务不会重复入队
+        """
+        queued = 0
+        seen = set()
+        for original_task in tasks:
+            fingerprint = None
+            if self.dedup:
                 try:
-                    response = future.result()
-                    if 'task_id' in response:
-                        task_id = response['task_id']
-                        task_ids.append(task_id)
-                        task_info.append({
-                            'task_id': task_id,
-                            'status': 'Submitted',
-                            'output_file': os.path.join(output_dir, f"video_{i + 1}_{task_id}.mp4"),
-                            'original_task': original_task
-                        })
-                        print(f"任务 {i + 1}/{len(tasks)} 已提交，任务ID: {task_id}")
-                    else:
-                        print(f"任务 {i + 1}/{len(tasks)} 提交失败: {response}")
-                        task_info.append({
-                            'task_id': None,
-                            'status': 'Failed',
-                            'error': response,
-                            'original_task': original_task
-                        })
-                except Exception as e:
-                    print(f"任务 {i + 1}/{len(tasks)} 提交出错: {str(e)}")
-                    task_info.append({
-                        'task_id': None,
-                        'status': 'Error',
-                        'error': str(e),
-                        'original_task': original_task
-                    })
-
-            # 添加短暂延迟避免API限流
-            time.sleep(10)
-
-        # 生成任务提交记录
-        print("\n=== 批量提交视频任务 ===")
-        print(f"总提交任务数: {len(task_info)}")
-
-        for task in task_info:
-            db_task = VideoTask(
-                task_id=task.get('task_id'),
-                model=task['original_task'].get('model'),
-                prompt=task['original_task'].get('prompt'),
-                first_frame_image=task['original_task'].get('first_frame_image'),
-                prompt_optimizer=task['original_task'].get('prompt_optimizer'),
-                subject_reference=json.dumps(task['original_task'].get('subject_reference')),
-                video_url=task['original_task'].get('video_url'),
-                status=task.get('status'),
-                error=json.dumps(task.get('error')),
-                output_file=task.get('output_file'),
-                submit_time=datetime.now()
-            )
-            self.db.add(db_task)
+                    fingerprint = task_fingerprint(original_task, self.image_cache.content_hash)
+                except OSError as e:
+                    logger.warning("计算任务指纹出错，不做去重: %s", e)
+                if fingerprint in seen or (fingerprint and self._release_fingerprint(fingerprint)):
+                    logger.info("任务已在队列中或正在生成，跳过: %s", original_task.get('prompt'))
+                    continue
+                seen.add(fingerprint)
+            self.save_task_record({'task_id': None, 'status': 'Queued', 'fingerprint': fingerprint,
+                                   'original_task': original_task})
+            queued += 1
+        self.writer.flush()
+        logger.info("已入队 %d 个任务", queued)
+        return queued
+
+    @staticmethod
+    def _release_fingerprint(fingerprint):
+        """指纹对应的任务仍未结束时返回True；已结束的记录释放指纹，是否复用视频交给结果缓存"""
+        with session_scope() as db:
+            row = db.query(VideoTask).filter(VideoTask.fingerprint == fingerprint).first()
+            if row is None:
+                return False
+            if row.status in TERMINAL_STATUSES:
+                row.fingerprint = None
+                return False
+            return True
+
+    def run_worker(self, output_dir="output", worker_id=None, lease_seconds=60, claim_batch=10, max_workers=3,
+                   max_in_flight=20, check_interval=5, max_check_interval=60, download_workers=3,
+                   idle_interval=5, cache_policy='always', cache_max_age=None):
+        """
+        worker模式：从数据库认领任务并处理，可在多个进程或主机上同时运行
+
+        - 排队中(Queued)的任务由worker提交，已提交的任务由worker轮询和下载
+        - 认领的任务带有 lease_seconds 秒的租约，运行期间后台续约；worker崩溃后租约过期，其他worker接手
+        - 数据库中不再有未结束的任务时退出；其他worker仍在处理时保持等待，以便接手其崩溃后遗留的任务
+
+        参数:
+        - worker_id: worker标识，默认由主机名和进程号生成
+        - claim_batch: 每次最多认领的任务数
+        - max_in_flight: 本worker同时处理的最大任务数，为None时只受 claim_batch 限制
+        - idle_interval: 没有可认领的任务时的等待间隔(秒)
+        其余参数同 process_batch
+        """
+        self.result_cache.check_policy(cache_policy, cache_max_age)
+        os.makedirs(output_dir, exist_ok=True)
+        lease = TaskLease(worker_id, lease_seconds).start()
+        logger.info("worker %s 已启动", lease.worker_id)
+        task_info = []
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            def admit(in_flight):
+                """认领新任务，排队中的任务先提交；没有任何未结束的任务时返回None"""
+                capacity = claim_batch if max_in_flight is None else min(claim_batch, max_in_flight - in_flight)
+                if capacity <= 0:
+                    return []
+                rows = lease.claim(capacity)
+                if not rows:
+                    if not in_flight and not lease.has_open_tasks():
+                        return None
+                    if not in_flight:
+                        time.sleep(idle_interval)
+                    return []
+                futures = [executor.submit(self._take_claimed, row, output_dir, cache_policy, cache_max_age)
+                           for row in rows]
+                claimed = [future.result() for future in futures]
+                task_info.extend(claimed)
+                return [task for task in claimed if self.needs_tracking(task)]
+
+            try:
+                self._track_tasks([], check_interval, max_check_interval, download_workers, admit=admit)
+            finally:
+                lease.release()
+
+        logger.info("worker %s 结束，共处理 %d 个任务", lease.worker_id, len(task_info))
+        return task_info
+
+    def _take_claimed(self, row, output_dir, cache_policy, cache_max_age):
+        """处理认领到的记录：排队中的任务提交(或命中结果缓存)，已提交的任务接回轮询"""
+        if row.status != 'Queued':
+            task = self._task_from_row(row, output_dir)
+            if os.path.exists(task['output_file']):
+                self.mark_downloaded(task)
+            elif row.submit_time:
+                task['submitted_at'] = row.submit_time.timestamp()
+            return task
 
-        self.db.commit()
-        self.db.close()
+        original_task = self._task_from_row(row, output_dir)['original_task']
+        task = self._reuse_cached(row.fingerprint, row.id, output_dir, cache_policy, cache_max_age, original_task)
+        if task is not None:
+            self._save_claimed(row.id, task, complete_time=datetime.now(), fingerprint=None)
+            return task
 
-        # 跟踪所有任务的完成情况
-        print("\n开始跟踪任务状态...")
-        pending_tasks = [t for t in task_info if t['task_id'] is not None]
-        print(pending_tasks)
-        # print(f"pengding的任务： {",".join(pending_tasks)}")
-        completed_tasks = [t for t in task_info if t['task_id'] is None]
+        task = self._create(original_task, row.id, output_dir)
+        if task['task_id']:
+            task['fingerprint'] = row.fingerprint
+            self._save_claimed(row.id, task, submit_time=datetime.now())
+            self.record_event(task['task_id'], 'Submitted')
+        else:
+            self._save_claimed(row.id, task, fingerprint=None)
+        return task
+
+    @staticmethod
+    def _save_claimed(row_id, task, **fields):
+        """按记录ID同步写入提交结果；排队的记录还没有task_id，不能交给按task_id更新的写线程"""
+        values = {
+            'task_id': task.get('task_id'),
+            'status': task['status'],
+            'api_key_id': task.get('api_key_id'),
+            'output_file': task.get('output_file'),
+            'error': json.dumps(task.get('error')),
+        }
+        values.update(fields)
+        with session_scope() as db:
+            db.query(VideoTask).filter(VideoTask.id == row_id).update(values)
+
+    @staticmethod
+    def _task_from_row(row, output_dir):
+        """由数据库记录还原任务信息"""
+        return {
+            'task_id': row.task_id,
+            'status': row.status,
+            'video_url': row.video_url,
+            'fingerprint': row.fingerprint,
+            'api_key_id': row.api_key_id,
+            'output_file': row.output_file or os.path.join(output_dir, f"video_{row.task_id}.mp4"),
+            'original_task': {
+                'model': row.model,
+                'prompt': row.prompt,
+                'first_frame_image': row.first_frame_image,
+                'prompt_optimizer': row.prompt_optimizer,
+                'subject_reference': json.loads(row.subject_reference) if row.subject_reference else None,
+            },
+        }
+
+    def _track_tasks(self, pending_tasks, check_interval, max_check_interval, download_workers,
+                     ready_tasks=(), admit=None):
+        """
+        轮询任务直至全部结束，成功的任务交给下载线程池
 
-        progress_bar = tqdm(total=len(pending_tasks), desc="视频生成进度")
-        completed_count = 0
+        - pending_tasks: 已提交、待查询状态的任务
+        - ready_tasks: 已生成成功、可直接下载的任务
+        - admit(in_flight): 每轮查询前调用，传入当前在途任务数，返回新提交的任务；返回None表示没有更多任务
+        """
+        progress_bar = tqdm(total=len(pending_tasks) + len(ready_tasks), desc="视频生成进度")
 
-        while pending_tasks:
-            for task in pending_tasks:
+        # 按任务各自的下次查询时间调度，预期生成耗时从历史任务中学习
+        with session_scope() as db:
+            expected_times = learn_expected_times(db)
+        scheduler = PollScheduler(expected_times,
+                                  min_interval=check_interval,
+                                  max_interval=max(check_interval, max_check_interval))
+        for task in pending_tasks:
+            scheduler.add(task, task['original_task'].get('model'), task.get('submitted_at'))
+
+        def on_downloaded(task):
+            self.mark_downloaded(task)
+            progress_bar.update(1)
+
+        def on_download_error(task, error):
+            self.mark_download_failed(task, error)
+            progress_bar.update(1)
+
+        download_pool = DownloadPool(self.download_task, workers=download_workers,
+                                     on_done=on_downloaded, on_error=on_download_error)
+        for task in ready_tasks:
+            download_pool.submit(task)
+
+        exhausted = admit is None
+        while True:
+            if not exhausted:
+                new_tasks = admit(len(scheduler))
+                if new_tasks is None:
+                    exhausted = True
+                elif new_tasks:
+                    for task in new_tasks:
+                        scheduler.add(task, task['original_task'].get('model'), task.get('submitted_at'))
+                    progress_bar.total += len(new_tasks)
+                    progress_bar.refresh()
+            if not scheduler:
+                if exhausted:
+                    break
+                continue
+
+            self.metrics.queue_depth.set(len(scheduler), stage='poll')
+            self.metrics.queue_depth.set(download_pool.pending(), stage='download')
+            due_tasks = scheduler.pop_due()
+            if not due_tasks:
+                with span('poll.sleep'):
+                    time.sleep(scheduler.next_due_in())
+                continue
+
+            updates = []
+            for task in due_tasks:
                 try:
-                    status_info = self.check_task_status(task['task_id'])
-                    current_status = status_info.get('status')
-                    task['current_status'] = current_status
-                    if current_status == 'Success':
-                        # 下载成功生成的视频
-                        file_id = status_info.get('file_id')
-
-                        if file_id:
-                            self.download_video(file_id, task['output_file'])
-                            task['status'] = 'Completed'
-                            task['video_url'] = file_id
-                            # 更新数据库状态和完成时间
-                            db_task = self.db.query(VideoTask).filter(VideoTask.task_id == task['task_id']).first()
-                            if db_task:
-                                db_task.status = 'Completed'
-                                db_task.complete_time = datetime.now()
-                                db_task.video_url = file_id
-                                self.db.commit()
-                            pending_tasks.remove(task)
-                            completed_tasks.append(task)
-                            completed_count += 1
-                            progress_bar.update(1)
-                    elif current_status == 'Fail':
-                        task['status'] = 'Failed'
-                        task['error'] = status_info
-                        # 更新数据库状态、错误信息和完成时间
-                        db_task = self.db.query(VideoTask).filter(VideoTask.task_id == task['task_id']).first()
-                        if db_task:
-                            db_task.status = 'Failed'
-                            db_task.error = json.dumps(status_info)
-                            db_task.complete_time = datetime.now()
-                            self.db.commit()
-
-                        pending_tasks.remove(task)
-                        completed_tasks.append(task)
-                        completed_count += 1
+                    status_info = self.check_task_status(task['task_id'], task.get('api_key_id'))
+                    outcome = self.apply_status(task, status_info, updates)
+                    if outcome == 'download':
+                        # 交给下载线程池下载，轮询继续进行
+                        download_pool.submit(task)
+                        scheduler.discard(task)
+                    elif outcome == 'failed':
+                        scheduler.discard(task)
                         progress_bar.update(1)
+                    else:
+                        scheduler.reschedule(task)
                 except Exception as e:
-                    print(f"检查任务 {task['task_id']} 状态出错: {str(e)}")
+                    logger.error("检查任务 %s 状态出错: %s", task['task_id'], e)
+                    scheduler.reschedule(task)
 
-            if pending_tasks:
-                time.sleep(check_interval)
+            # 本轮查询产生的状态变化在一个事务中写入
+            if updates:
+                self.update_task_records(updates)
 
+        # 等待剩余的下载完成
+        download_pool.close()
+        for stage in ('poll', 'download'):
+            self.metrics.queue_depth.set(0, stage=stage)
+        self.writer.flush()
         progress_bar.close()
+        self.log_summary(download_pool.stats)
 
-        # 保存任务报告
+    def apply_status(self, task, status_info, updates):
+        """
+        处理一次状态查询结果，需写入数据库的变化追加到 updates，返回任务接下来的去向：
+        'download' 已生成，交给下载；'failed' 生成失败；None 仍在排队或生成中，继续轮询
+        """
+        current_status = status_info.get('status')
+        task['current_status'] = current_status
+        if current_status == 'Success' and status_info.get('file_id'):
+            task['video_url'] = status_info.get('file_id')
+            self.record_event(task['task_id'], 'Success')
+            return 'download'
+        if current_status == 'Fail':
+            task['status'] = 'Failed'
+            task['error'] = status_info
+            # 更新数据库状态、错误信息和完成时间
+            # 失败的任务释放指纹，之后可以重新提交
+            updates.append((task['task_id'], {'status': 'Failed',
+                                              'error': json.dumps(status_info),
+                                              'complete_time': datetime.now(),
+                                              'fingerprint': None}))
+            self.metrics.tasks.inc(status='Failed')
+            self.record_event(task['task_id'], 'Fail', error_code=status_code(status_info))
+            return 'failed'
+        # 记录排队/生成中等中间状态，供任务监控查看进度；Success 但还没有文件ID时继续轮询
+        if current_status and current_status != 'Success' and current_status != task['status']:
+            task['status'] = current_status
+            updates.append((task['task_id'], {'status': current_status}))
+            self.record_event(task['task_id'], current_status)
+        return None
+
+    def log_summary(self, download_stats):
+        """批次结束时输出下载、缓存、密钥和参考图上传的统计"""
+        logger.info(download_stats.summary())
+        logger.info(self.image_cache.summary())
+        logger.info(self.result_cache.summary())
+        if len(self.key_pool) > 1:
+            logger.info(self.key_pool.summary())
+        if self.uploader is not None:
+            logger.info(self.uploader.summary())
+
+    def write_report(self, task_info, output_dir):
+        """保存任务报告"""
         report_path = os.path.join(output_dir, "generation_report.json")
         with open(report_path, 'w', encoding='utf-8') as f:
             json.dump(task_info, f, ensure_ascii=False, indent=2)
 
-        print(f"\n报告已保存至: {report_path}")
-        print(f"生成的视频已保存至: {output_dir}")
+        logger.info("报告已保存至: %s", report_path)
+        logger.info("生成的视频已保存至: %s", output_dir)
 
-        return task_info
+    def process_batch_async(self, tasks, output_dir="output", max_workers=3, check_interval=5,
+                            max_check_interval=60, download_workers=3, queue_size=100, max_in_flight=None,
+                            cache_policy='always', cache_max_age=None, batch_id=None):
+        """
+        以异步流水线方式批量处理视频生成任务
+
+        提交、轮询、下载三个阶段并发执行，阶段之间通过有界队列衔接，
+        已完成的任务在其余任务仍在提交时即可开始下载
+
+        参数:
+        - download_workers: 并行下载数
+        - queue_size: 阶段间队列的容量
+        - max_in_flight: 同时在服务端排队/生成的最大任务数，为None时不限制
+        其余参数同 process_batch
+        """
+        pipeline = BatchPipeline(self,
+                                 output_dir=output_dir,
+                                 max_workers=max_workers,
+                                 check_interval=check_interval,
+                                 max_check_interval=max_check_interval,
+                                 download_workers=download_workers,
+                                 queue_size=queue_size,
+                                 max_in_flight=max_in_flight,
+                                 cache_policy=cache_policy,
+                                 cache_max_age=cache_max_age,
+                                 batch_id=batch_id)
+        return asyncio.run(pipeline.run(tasks))
+
+    def download_task(self, task):
+        """下载任务对应的视频，task中需包含video_url(file_id)和output_file，有task_id时记录下载事件"""
+        self.record_event(task.get('task_id'), 'DownloadStarted')
+        with self.metrics.download_latency.time():
+            output_path = self.download_video(task['video_url'], task['output_file'], task.get('api_key_id'))
+        size = os.path.getsize(output_path)
+        self.metrics.download_bytes.inc(size)
+        self.record_event(task.get('task_id'), 'DownloadFinished', bytes=size)
+        return output_path
+
+    def mark_downloaded(self, task):
+        """视频下载完成，更新任务和数据库状态"""
+        task['status'] = 'Completed'
+        self.metrics.tasks.inc(status='Completed')
+        if task.get('submitted_at'):
+            self.metrics.generation_time.observe(time.time() - task['submitted_at'],
+                                                 model=task['original_task'].get('model'))
+        self.update_task_record(task['task_id'],
+                                status='Completed',
+                                video_url=task['video_url'],
+                                complete_time=datetime.now())
+        try:
+            self.result_cache.record(task.get('fingerprint'), task['task_id'], task['output_file'])
+        except Exception as e:
+            logger.warning("记录任务 %s 的结果缓存出错: %s", task['task_id'], e)
+
+    def mark_download_failed(self, task, error):
+        """视频已生成但下载失败，保留Success状态以便后续在任务监控中重新下载"""
+        logger.error("下载任务 %s 的视频出错: %s", task['task_id'], error)
+        self.record_event(task['task_id'], 'DownloadFailed', error_code=type(error).__name__)
+        task['status'] = 'Success'
+        task['error'] = str(error)
+        self.update_task_record(task['task_id'],
+                                status='Success',
+                                video_url=task['video_url'],
+                                error=json.dumps(str(error)))
+
+    def record_event(self, task_id, event, **fields):
+        """追加任务生命周期事件(由写线程写入 video_task_events)，fields 可包含 bytes、error_code"""
+        if task_id:
+            if fields.get('error_code') is not None:
+                fields['error_code'] = str(fields['error_code'])
+            self.writer.event(task_id, event, **fields)
 
-    def check_tasks_batch(self, task_ids):
-        """批量检查多个任务的状态"""
+    def save_task_record(self, task):
+        """将任务记录交给写线程写入数据库"""
+        self.writer.insert({
+            'task_id': task.get('task_id'),
+            'model': task['original_task'].get('model'),
+            'prompt': task['original_task'].get('prompt'),
+            'first_frame_image': task['original_task'].get('first_frame_image'),
+            'prompt_optimizer': task['original_task'].get('prompt_optimizer'),
+            'subject_reference': json.dumps(task['original_task'].get('subject_reference')),
+            'video_url': task['original_task'].get('video_url'),
+            'status': task.get('status'),
+            'error': json.dumps(task.get('error')),
+            'output_file': task.get('output_file'),
+            'api_key_id': task.get('api_key_id'),
+            'batch_id': task.get('batch_id'),
+            # 指纹列唯一，关闭去重时不写入，避免相同任务的记录冲突
+            'fingerprint': task.get('fingerprint') if self.dedup else None,
+            'submit_time': datetime.now(),
+            'complete_time': datetime.now() if task.get('status') == 'Completed' else None
+        })
+
+    def update_task_record(self, task_id, **fields):
+        """按task_id更新数据库中的任务记录(异步写入)"""
+        self.writer.update(task_id, **fields)
+
+    def update_task_records(self, updates):
+        """批量更新任务记录，updates 为 [(task_id, {字段: 值}), ...]，由写线程合并后批量提交"""
+        self.writer.update_many(updates)
+
+    def close(self):
+        """写完剩余的数据库变更并释放HTTP连接池"""
+        self.writer.close()
+        self.transport.close()
+
+    def check_tasks_batch(self, task_ids, key_ids=None):
+        """批量检查多个任务的状态，key_ids 为 {task_id: 密钥ID}，未给出时使用默认密钥"""
+        key_ids = key_ids or {}
         with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_id = {executor.submit(self.check_task_status, task_id): task_id for task_id in task_ids}
+            future_to_id = {executor.submit(self.check_task_status, task_id, key_ids.get(task_id)): task_id
+                            for task_id in task_ids}
             results = {}
             for future in concurrent.futures.as_completed(future_to_id):
                 task_id = future_to_id[future]
@@ -266,12 +881,14 @@ class MiniMaxVideoBatchGenerator:
                     results[task_id] = {"error": str(e)}
             return results
 
-    def download_videos_batch(self, tasks_with_urls):
-        """批量下载多个视频"""
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = [executor.submit(self.download_video, task['video_url'], task['output_file'])
-                       for task in tasks_with_urls]
-            concurrent.futures.wait(futures)
+    def download_videos_batch(self, tasks_with_urls, download_workers=3):
+        """批量下载多个视频，返回下载统计"""
+        download_pool = DownloadPool(self.download_task, workers=download_workers)
+        for task in tasks_with_urls:
+            download_pool.submit(task)
+        download_pool.close()
+        logger.info(download_pool.stats.summary())
+        return download_pool.stats.snapshot()
 
 
 def read_tasks_from_file(file_path):
@@ -280,24 +897,179 @@ def read_tasks_from_file(file_path):
         return json.load(f)
 
 
+def iter_tasks_from_file(file_path):
+    """
+    逐个读取任务配置
+
+    JSONL文件(每行一个任务)按行惰性读取，不会把整个文件载入内存；
+    内容以 [ 开头的JSON数组文件按原方式整体读取
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        first_char = f.read(1)
+        while first_char and first_char.isspace():
+            first_char = f.read(1)
+        f.seek(0)
+        if first_char == '[':
+            yield from json.load(f)
+            return
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning("任务文件第 %d 行解析失败，已跳过: %s", line_no, e)
+
+
 def main():
     parser = argparse.ArgumentParser(description='MiniMax海螺AI视频批量生成工具')
-    parser.add_argument('--api_key', required=True, help='API密钥')
-    parser.add_argument('--tasks_file', required=True, help='任务配置JSON文件路径')
+    parser.add_argument('--api_key', help='API密钥，多个密钥用逗号分隔；未指定时读取环境变量/.env中的API_KEYS或API_KEY')
+    parser.add_argument('--api_keys_file', help='密钥池配置文件(JSON)，可为每个密钥配置名称、余额和限速')
+    parser.add_argument('--tasks_file', help='任务配置文件路径，支持JSON数组或JSONL(每行一个任务)')
+    parser.add_argument('--resume', action='store_true', help='恢复中断的批次：继续轮询和下载数据库中未完成的任务')
+    parser.add_argument('--enqueue', action='store_true', help='只把 --tasks_file 中的任务写入数据库排队，由worker处理')
+    parser.add_argument('--worker', action='store_true', help='worker模式：从数据库认领任务处理，可多进程/多主机同时运行')
+    parser.add_argument('--worker_id', help='worker标识，默认由主机名和进程号生成')
+    parser.add_argument('--lease_seconds', type=int, default=60, help='worker认领任务的租约时长(秒)')
+    parser.add_argument('--latency_report', action='store_true',
+                        help='按模型输出服务端排队/生成/下载各阶段耗时统计后退出')
+    parser.add_argument('--metrics_port', type=int, default=None, help='在该端口提供Prometheus格式的/metrics接口')
+    parser.add_argument('--metrics_file', help='定期把指标快照写入该JSON文件')
+    parser.add_argument('--metrics_interval', type=float, default=30, help='写入指标文件的间隔(秒)')
+    parser.add_argument('--log_level', default=None, help='日志级别(DEBUG/INFO/WARNING/ERROR)，默认读取环境变量LOG_LEVEL，再退回INFO')
+    parser.add_argument('--log_json', action='store_true', help='控制台日志输出为JSON行')
+    parser.add_argument('--log_file', help='另外把日志以JSON行格式写入该文件')
+    parser.add_argument('--trace_file', help='记录图片编码/接口调用/下载/数据库提交的耗时区间，'
+                                             '保存为Chrome trace JSON(可用Perfetto打开)')
+    parser.add_argument('--database_url', help='数据库连接地址，默认读取环境变量DATABASE_URL，再退回本地SQLite')
+    parser.add_argument('--db_pool_size', type=int, default=None, help='数据库连接池大小(SQLite不适用)')
+    parser.add_argument('--db_async', action='store_true', help='async引擎的轮询阶段使用异步数据库会话(需安装aiosqlite/asyncpg)')
     parser.add_argument('--output_dir', default='output', help='视频输出目录')
     parser.add_argument('--max_workers', type=int, default=3, help='最大并行任务数')
-    parser.add_argument('--check_interval', type=int, default=5, help='任务状态检查间隔(秒)')
+    parser.add_argument('--max_in_flight', type=int, default=20,
+                        help='同时在服务端排队/生成的最大任务数，0表示不限制')
+    parser.add_argument('--check_interval', type=int, default=5, help='任务状态检查最小间隔(秒)')
+    parser.add_argument('--max_check_interval', type=int, default=60, help='任务状态检查最大间隔(秒)')
+    parser.add_argument('--engine', choices=['sync', 'async'], default='sync',
+                        help='执行引擎：sync为分阶段执行，async为提交/轮询/下载并发流水线')
+    parser.add_argument('--download_workers', type=int, default=3, help='并行下载数')
+    parser.add_argument('--pool_size', type=int, default=10, help='HTTP连接池大小')
+    parser.add_argument('--max_retries', type=int, default=3, help='5xx和连接错误的最大重试次数')
+    parser.add_argument('--submit_rate', type=float, default=0.5, help='提交任务限速(次/秒)')
+    parser.add_argument('--query_rate', type=float, default=5, help='状态查询限速(次/秒)')
+    parser.add_argument('--retrieve_rate', type=float, default=5, help='文件获取限速(次/秒)')
+    parser.add_argument('--image_quality', type=int, default=90, help='图片预处理的JPEG质量')
+    parser.add_argument('--image_max_side', type=int, default=None, help='图片预处理的最大边长，默认按模型决定')
+    parser.add_argument('--no_preflight', action='store_true', help='不做图片预处理，按原图提交')
+    parser.add_argument('--upload_images', action='store_true', help='参考图通过文件接口上传一次并复用file_id')
+    parser.add_argument('--no_dedup', action='store_true', help='不按任务内容去重，相同任务也重新提交')
+    parser.add_argument('--cache_policy', choices=['always', 'never', 'max-age'], default='always',
+                        help='结果缓存策略：always复用已生成的相同视频，never总是重新生成，max-age只复用近期生成的视频')
+    parser.add_argument('--cache_max_age', type=float, default=None,
+                        help='cache_policy为max-age时可复用的视频最长生成时间(小时)')
 
     args = parser.parse_args()
+    if not (args.resume or args.worker or args.latency_report) and not args.tasks_file:
+        parser.error('未指定 --resume 或 --worker 时必须提供 --tasks_file')
+
+    rate_limits = {
+        'submit': (args.submit_rate, max(1, int(args.submit_rate * 5))),
+        'query': (args.query_rate, max(1, int(args.query_rate * 2))),
+        'retrieve': (args.retrieve_rate, max(1, int(args.retrieve_rate))),
+    }
+    # .env 中的 API_KEY(S)、DATABASE_URL 等配置
+    load_dotenv()
+    setup_logging(args.log_level, args.log_json or None, args.log_file)
+    configure_db(url=args.database_url, pool_size=args.db_pool_size, async_mode=args.db_async or None)
+    if args.latency_report:
+        # 只读取数据库中的任务事件，不需要API密钥
+        init_db()
+        with session_scope() as db:
+            print(format_latency_breakdown(latency_breakdown(db)) or "暂无任务事件")
+        return
+    if args.trace_file:
+        start_tracing(args.trace_file)
+    if args.api_keys_file:
+        key_pool = KeyPool.from_file(args.api_keys_file, rate_limits)
+    elif args.api_key:
+        key_pool = KeyPool([key.strip() for key in args.api_key.split(',') if key.strip()], rate_limits)
+    else:
+        key_pool = KeyPool.from_env(rate_limits)
+    preflight = False if args.no_preflight else {'quality': args.image_quality, 'max_side': args.image_max_side}
+    generator = MiniMaxVideoBatchGenerator(key_pool, pool_size=args.pool_size, max_retries=args.max_retries,
+                                           rate_limits=rate_limits, preflight=preflight,
+                                           upload_images=args.upload_images, dedup=not args.no_dedup)
+    exporters = []
+    if args.metrics_port:
+        exporters.append(MetricsServer(generator.metrics.registry, args.metrics_port).start())
+    if args.metrics_file:
+        exporters.append(MetricsDumper(generator.metrics.registry, args.metrics_file, args.metrics_interval).start())
+    try:
+        run_cli(generator, args)
+    finally:
+        generator.close()
+        for exporter in exporters:
+            exporter.close()
+        stop_tracing()
+
+
+def run_cli(generator, args):
+    """按命令行参数执行入队/worker/恢复/批量生成"""
+    max_in_flight = args.max_in_flight or None
+    cache_max_age = args.cache_max_age * 3600 if args.cache_max_age else None
+    if args.enqueue or args.worker:
+        if args.tasks_file:
+            generator.enqueue(iter_tasks_from_file(args.tasks_file))
+        if args.worker:
+            generator.run_worker(
+                output_dir=args.output_dir,
+                worker_id=args.worker_id,
+                lease_seconds=args.lease_seconds,
+                max_workers=args.max_workers,
+                max_in_flight=max_in_flight,
+                check_interval=args.check_interval,
+                max_check_interval=args.max_check_interval,
+                download_workers=args.download_workers,
+                cache_policy=args.cache_policy,
+                cache_max_age=cache_max_age
+            )
+        return
+
+    if args.resume:
+        generator.resume(
+            output_dir=args.output_dir,
+            check_interval=args.check_interval,
+            max_check_interval=args.max_check_interval,
+            download_workers=args.download_workers
+        )
+        return
 
-    tasks = read_tasks_from_file(args.tasks_file)
-    generator = MiniMaxVideoBatchGenerator(args.api_key)
-    generator.process_batch(
-        tasks=tasks,
-        output_dir=args.output_dir,
-        max_workers=args.max_workers,
-        check_interval=args.check_interval
-    )
+    tasks = iter_tasks_from_file(args.tasks_file)
+    if args.engine == 'async':
+        generator.process_batch_async(
+            tasks=tasks,
+            output_dir=args.output_dir,
+            max_workers=args.max_workers,
+            check_interval=args.check_interval,
+            max_check_interval=args.max_check_interval,
+            download_workers=args.download_workers,
+            max_in_flight=max_in_flight,
+            cache_policy=args.cache_policy,
+            cache_max_age=cache_max_age
+        )
+    else:
+        generator.process_batch(
+            tasks=tasks,
+            output_dir=args.output_dir,
+            max_workers=args.max_workers,
+            check_interval=args.check_interval,
+            max_check_interval=args.max_check_interval,
+            download_workers=args.download_workers,
+            max_in_flight=max_in_flight,
+            cache_policy=args.cache_policy,
+            cache_max_age=cache_max_age
+        )
 
 
 if __name__ == "__main__":
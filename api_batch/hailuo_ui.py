@@ -4,15 +4,90 @@ import streamlit as st
 import json
 import os
 from hailuo import MiniMaxVideoBatchGenerator, read_tasks_from_file
+from core.batch_runner import BatchRunner, batch_progress
+from core.log import get_logger, setup_logging
+from core.task_monitor import downloadable_tasks, list_tasks, pollable_tasks, status_summary, \
+    task_filters, task_options
 import pandas as pd
 from PIL import Image
 import base64
 from dotenv import load_dotenv
-from orm.base import SessionLocal
+from orm.base import SessionLocal, configure as configure_db, session_scope
 from orm.video_config import VideoConfig
-from orm.video_task import VideoTask
+from orm.video_task import SETTLED_STATUSES
 
 load_dotenv()
+
+
+@st.cache_resource(show_spinner=False)
+def init_database():
+    """orm 导入时 .env 尚未加载，按 .env 中的 DATABASE_URL、DB_* 重新配置一次数据库；页面重新运行时不重建连接池"""
+    return configure_db()
+
+
+init_database()
+
+
+@st.cache_resource(show_spinner=False)
+def init_logging():
+    """日志输出在进程内只配置一次，页面每次重新运行时复用"""
+    return setup_logging()
+
+
+init_logging()
+logger = get_logger('ui')
+
+
+@st.cache_resource
+def get_generator(api_key):
+    """生成器持有连接池和数据库写线程，按密钥在进程内共享，页面重新运行或刷新浏览器后仍是同一个"""
+    return MiniMaxVideoBatchGenerator(api_key)
+
+
+@st.cache_resource
+def get_batch_runner():
+    """后台批次运行器，整个Streamlit进程共用一个，刷新页面不会中断正在运行的批次"""
+    return BatchRunner()
+
+
+BATCH_STATUS_NAMES = {'Queued': '排队中', 'Running': '运行中', 'Finished': '已完成', 'Failed': '出错',
+                      'Cancelled': '已取消'}
+
+
+def render_batches(runner):
+    """显示后台批次及其进度，进度从数据库按批次统计"""
+    jobs = runner.jobs()[:10]
+    if not jobs:
+        st.info("ℹ️ 暂无后台批次，在「配置任务」选项卡中开始批量生成后会在这里显示进度")
+        return
+    with session_scope() as db:
+        progress = batch_progress(db, [job.id for job in jobs])
+
+    rows = []
+    for job in jobs:
+        entry = progress[job.id]
+        rows.append({
+            "批次": job.id,
+            "状态": BATCH_STATUS_NAMES.get(job.status, job.status),
+            "任务数": job.total,
+            "已提交": entry['recorded'],
+            "已结束": entry['finished'],
+            "任务状态": ", ".join(f"{status}: {count}" for status, count in sorted(entry['statuses'].items(),
+                                                                               key=lambda item: str(item[0]))),
+            "加入时间": job.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            "错误": job.error or "",
+        })
+    st.dataframe(pd.DataFrame(rows), use_container_width=True)
+
+    for job in jobs:
+        if job.status == 'Running':
+            entry = progress[job.id]
+            st.progress(min(entry['finished'] / job.total, 1.0) if job.total else 0,
+                        text=f"批次 {job.id}: 已结束 {entry['finished']}/{job.total}")
+        elif job.status == 'Queued':
+            if st.button(f"取消排队中的批次 {job.id}", key=f"cancel_{job.id}"):
+                runner.cancel(job.id)
+                st.rerun()
 # 设置页面标题和图标
 st.set_page_config(
     page_title="海螺AI视频批量生成工具",
@@ -25,24 +100,65 @@ st.set_page_config(
 )
 
 
-def refresh_task_status():
-    db = SessionLocal()
+# 监控页的数据库读取缓存几秒，页面频繁重新运行时不重复查询；刷新任务状态后清空
+MONITOR_CACHE_TTL = 5
+# 每次手动刷新最多查询的任务数(最近提交的优先)
+REFRESH_LIMIT = 500
+
+
+@st.cache_data(ttl=MONITOR_CACHE_TTL)
+def load_task_page(statuses, models, date_from, date_to, page, page_size):
+    with session_scope() as db:
+        return list_tasks(db, task_filters(statuses, models, date_from, date_to), page, page_size)
+
+
+@st.cache_data(ttl=MONITOR_CACHE_TTL)
+def load_status_summary(statuses, models, date_from, date_to):
+    with session_scope() as db:
+        return status_summary(db, task_filters(statuses, models, date_from, date_to))
+
+
+@st.cache_data(ttl=60)
+def load_task_options():
+    with session_scope() as db:
+        return task_options(db)
+
+
+@st.cache_data(ttl=MONITOR_CACHE_TTL)
+def load_downloadable_tasks():
+    with session_scope() as db:
+        return downloadable_tasks(db)
+
+
+def refresh_pending_tasks(generator):
+    """只向接口查询尚未结束的任务，状态变化交给写线程批量写入数据库"""
+    with session_scope() as db:
+        key_ids = pollable_tasks(db, REFRESH_LIMIT)
+    if not key_ids:
+        st.info("ℹ️ 没有正在进行的任务")
+        return
+    logger.info("批量刷新 %d 个任务的状态", len(key_ids))
     try:
-        tasks_in_db = db.query(VideoTask).all()
-        new_task_status = {}
-        for idx, task in enumerate(tasks_in_db):
-            new_task_status[idx] = {
-                'task_id': task.task_id,
-                'model': task.model,
-                'status': task.status,
-                'submit_time': task.submit_time,
-                'video_url': task.video_url
-            }
-        st.session_state.task_status = new_task_status
+        results = generator.check_tasks_batch(list(key_ids), key_ids)
     except Exception as e:
-        st.error(f"❌ 加载任务状态失败: {str(e)}")
-    finally:
-        db.close()
+        st.error(f"❌ 更新任务状态出错: {str(e)}")
+        return
+
+    updates = []
+    for task_id, result in results.items():
+        status = result.get('status')
+        if not status:
+            continue
+        fields = {'status': status}
+        if result.get('file_id'):
+            fields['video_url'] = result['file_id']
+        if status in SETTLED_STATUSES:
+            fields['complete_time'] = datetime.now()
+        updates.append((task_id, fields))
+    generator.update_task_records(updates)
+    generator.writer.flush()
+    st.cache_data.clear()
+    st.success(f"✅ 已查询 {len(results)} 个进行中的任务，{len(updates)} 个状态已更新")
 
 
 # 自定义CSS
@@ -214,8 +330,6 @@ if 'generator' not in st.session_state:
     st.session_state.generator = None
 if 'results' not in st.session_state:
     st.session_state.results = None
-if 'task_status' not in st.session_state:
-    st.session_state.task_status = {}
 
 # 标题和介绍
 st.title("🎬 海螺AI视频批量生成工具")
@@ -238,7 +352,7 @@ with tab1:
 
     if api_key:
         st.session_state.api_key = api_key
-        st.session_state.generator = MiniMaxVideoBatchGenerator(api_key)
+        st.session_state.generator = get_generator(api_key)
         st.success("✅ API密钥已设置")
 
     st.header("第二步：创建视频生成任务")
@@ -384,7 +498,6 @@ with tab1:
             if st.button("清空任务队列", key="clear_tasks"):
                 st.session_state.tasks = []
                 st.session_state.results = None
-                st.session_state.task_status = {}
                 st.rerun()
 
         with col2:
@@ -419,23 +532,16 @@ with tab1:
             if not os.path.exists(output_dir):
                 os.makedirs(output_dir)
 
-            # 开始生成任务
-            with st.spinner("正在提交任务..."):
-                try:
-                    results = st.session_state.generator.process_batch(
-                        tasks=st.session_state.tasks,
-                        output_dir=output_dir,
-                        max_workers=max_workers,
-                        check_interval=check_interval
-                    )
-                    st.session_state.results = results
-                    st.success("✅ 所有任务处理完成！")
-
-                    # 自动切换到结果页面
-                    st.query_params(tab="result")
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"❌ 处理任务时出错: {str(e)}")
+            # 批次在后台线程中运行，页面立即返回，可继续添加下一批任务并在「任务监控」中查看进度
+            job = get_batch_runner().submit(
+                st.session_state.generator,
+                st.session_state.tasks,
+                output_dir=output_dir,
+                max_workers=max_workers,
+                check_interval=check_interval
+            )
+            st.session_state.tasks = []
+            st.success(f"✅ 已加入后台队列(批次 {job.id})，可在「任务监控」选项卡中查看进度")
 
     with start_col2:
         if st.button("保存配置"):
@@ -465,141 +571,119 @@ with tab1:
 with tab2:
     st.header("任务执行监控")
 
-    # if not st.session_state.tasks:
-    #     st.warning("⚠️ 请先在「配置任务」选项卡中添加任务")
-    if not st.session_state.generator:
-        st.warning("⚠️ 请先设置API密钥")
+    st.subheader("后台批次")
+    batch_runner = get_batch_runner()
+    # 有批次在运行时每5秒自动刷新进度，只重新运行这一部分
+    st.fragment(run_every=5 if batch_runner.busy() else None)(render_batches)(batch_runner)
+
+    st.subheader("任务执行状态")
+    if st.button("刷新任务状态", disabled=not st.session_state.generator,
+                 help="只向接口查询尚未结束的任务，已完成和失败的任务不再查询"):
+        refresh_pending_tasks(st.session_state.generator)
+
+    # 筛选条件在数据库中执行，表格只读取当前页
+    status_options, model_options = load_task_options()
+    filter_col1, filter_col2, filter_col3 = st.columns(3)
+    with filter_col1:
+        status_filter = st.multiselect("状态", status_options)
+    with filter_col2:
+        model_filter = st.multiselect("模型", model_options)
+    with filter_col3:
+        date_range = st.date_input("提交日期", value=(), help="选择开始和结束日期，不选则不限")
+    date_from, date_to = (tuple(date_range) + (None, None))[:2] if isinstance(date_range, (list, tuple)) \
+        else (date_range, date_range)
+    filters = (tuple(status_filter), tuple(model_filter), date_from, date_to or date_from)
+
+    summary = load_status_summary(*filters)
+    total = summary['total']
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("总任务", total)
+    col2.metric("已完成", summary['completed'])
+    col3.metric("失败", summary['failed'])
+    col4.metric("进行中", summary['pending'])
+    st.progress(summary['completed'] / total if total > 0 else 0)
+
+    if total:
+        page_col1, page_col2 = st.columns([1, 3])
+        with page_col1:
+            page_size = st.selectbox("每页任务数", [20, 50, 100, 200], index=1)
+        pages = max((total + page_size - 1) // page_size, 1)
+        with page_col2:
+            # 筛选条件变化时页码回到第一页
+            page = st.number_input(f"页码 (共 {pages} 页)", min_value=1, max_value=pages, value=1,
+                                   key=f"task_page_{filters}_{page_size}")
+
+        rows, _ = load_task_page(*filters, page=page, page_size=page_size)
+        status_data = [{
+            "序号": (page - 1) * page_size + i + 1,
+            "任务ID": row['task_id'] or 'N/A',
+            "模型": row['model'] or '',
+            "状态": row['status'] or '未知',
+            "提示词": (row['prompt'] or '')[:50],
+            "提交时间": row['submit_time'],
+            "完成时间": row['complete_time'],
+            "批次": row['batch_id'] or '',
+        } for i, row in enumerate(rows)]
+        st.dataframe(pd.DataFrame(status_data), use_container_width=True)
     else:
-        # 手动刷新监控
-        if st.button("刷新任务状态"):
-            # 获取所有已提交任务的ID
-            refresh_task_status()
-            task_ids = [task.get('task_id') for task in st.session_state.task_status.values()
-                        if task.get('task_id') is not None and task.get('task_id') != '']
-            print(f"批量刷新任务状态{task_ids}")
-
-            if task_ids:
-                try:
-                    # 批量查询状态
-                    results = st.session_state.generator.check_tasks_batch(task_ids)
-                    # 更新任务状态并同步到数据库
-                    db = SessionLocal()
-                    try:
-                        for task_id, result in results.items():
-                            for idx, task in st.session_state.task_status.items():
-                                if task.get('task_id') == task_id:
-                                    # 更新 session_state 中的状态
-                                    st.session_state.task_status[idx]['status'] = result['status']
-
-                                    # 更新数据库中的状态
-                                    db_task = db.query(VideoTask).filter(VideoTask.task_id == task_id).first()
-                                    if db_task:
-                                        db_task.status = result['status']
-                                        db_task.video_url = result['file_id']
-                                        db_task.complete_time = datetime.now() if result['status'] in ['Success',
-                                                                                                       'Completed',
-                                                                                                       'Fail',
-                                                                                                       'Failed'] else None
-                                        db.commit()
-                    finally:
-                        db.close()
-
-                    st.success("✅ 任务状态已更新")
-                except Exception as e:
-                    st.error(f"❌ 更新任务状态出错: {str(e)}")
-            else:
-                st.info("ℹ️ 没有正在进行的任务")
-
-        # 显示任务状态表格
-        if st.session_state.task_status:
-            st.subheader("任务执行状态")
-
-            status_data = []
-            for idx, task in st.session_state.task_status.items():
-                status = task.get('status', '未知')
-                if isinstance(status, dict):
-                    status = json.dumps(status, ensure_ascii=False)  # 或提取关键字段如 status.get('status', 'Unknown')
-
-                status_info = {
-                    "序号": idx + 1,
-                    "任务ID": task.get('task_id', 'N/A'),
-                    "模型": task.get('model', ''),
-                    "状态": status,
-                    "提交时间": task.get('submit_time', ''),
-                }
-                status_data.append(status_info)
-
-            st.dataframe(pd.DataFrame(status_data), use_container_width=True)
-
-            # 进度统计
-            total = len(status_data)
-            completed = sum(1 for task in status_data if task['状态'] in ['Success', 'Completed'])
-            failed = sum(1 for task in status_data if task['状态'] in ['Failed', 'Fail'])
-            pending = total - completed - failed
-
-            # 进度条
-            st.progress(completed / total if total > 0 else 0)
-
-            # 进度详情
-            col1, col2, col3 = st.columns(3)
-            col1.metric("总任务", total)
-            col2.metric("已完成", completed)
-            col3.metric("失败", failed)
-        else:
-            st.info("ℹ️ 没有任务执行记录，请在「配置任务」选项卡中开始批量生成")
-    # 增加批量下载操作，选择taskid video_url以及  output_file
+        st.info("ℹ️ 没有符合条件的任务记录，请在「配置任务」选项卡中开始批量生成")
 
+    # 增加批量下载操作，选择taskid video_url以及  output_file
     st.subheader("📥 批量下载已完成视频")
 
-    if st.session_state.task_status:
-        # 获取所有有 video_url 的已完成任务
-        print(st.session_state.task_status.values())
-        downloadable_tasks = [
-            task for task in st.session_state.task_status.values()
-            if task.get('status') in ['Success', 'Completed'] and task.get('video_url')
-        ]
+    # 获取最近的有 video_url 的已完成任务
+    download_candidates = load_downloadable_tasks()
+    if not st.session_state.generator:
+        st.warning("⚠️ 请先设置API密钥")
+    elif download_candidates:
+        # 多选框选择任务
+        selected_indices = st.multiselect(
+            "选择要下载的视频任务",
+            options=range(len(download_candidates)),
+            format_func=lambda
+                i: f"任务ID: {download_candidates[i]['task_id']} - URL: {download_candidates[i]['video_url']}"
+        )
 
-        if downloadable_tasks:
-            # 多选框选择任务
-            selected_indices = st.multiselect(
-                "选择要下载的视频任务",
-                options=range(len(downloadable_tasks)),
-                format_func=lambda
-                    i: f"任务ID: {downloadable_tasks[i]['task_id']} - URL: {downloadable_tasks[i]['video_url']}"
-            )
+        # 构建参数
+        tasks_to_download = [
+            {
+                "task_id": t["task_id"],
+                "video_url": t["video_url"],
+                "api_key_id": t.get("api_key_id"),
+                "output_file": t.get("output_file") or os.path.join("output", f"{t['task_id']}.mp4")
+            }
+            for i in selected_indices
+            if (t := download_candidates[i])
+        ]
 
-            # 构建参数
-            tasks_to_download = [
-                {
-                    "video_url": t["video_url"],
-                    "output_file": t.get("output_file", os.path.join("output", f"{t['task_id']}.mp4"))
-                }
-                for i in selected_indices
-                if (t := downloadable_tasks[i])
-            ]
-
-            if st.button("开始批量下载"):
-                if tasks_to_download:
-                    try:
-                        with st.spinner("正在下载视频..."):
-                            results = st.session_state.generator.download_videos_batch(tasks_to_download)
-
-                        # 显示下载结果
-                        st.success("✅ 视频下载完成")
-                        # st.json(results)
-                    except Exception as e:
-                        st.error(f"❌ 下载失败: {str(e)}")
-                else:
-                    st.warning("⚠️ 请选择至少一个任务进行下载")
-        else:
-            st.info("ℹ️ 没有可下载的视频任务")
+        if st.button("开始批量下载"):
+            if tasks_to_download:
+                try:
+                    with st.spinner("正在下载视频..."):
+                        results = st.session_state.generator.download_videos_batch(tasks_to_download)
+
+                    # 显示下载结果
+                    if results['failed']:
+                        st.error(f"❌ {results['failed']} 个视频下载失败，成功 {results['completed']} 个")
+                    else:
+                        st.success(f"✅ 视频下载完成，共 {results['completed']} 个")
+                except Exception as e:
+                    st.error(f"❌ 下载失败: {str(e)}")
+            else:
+                st.warning("⚠️ 请选择至少一个任务进行下载")
     else:
-        st.info("ℹ️ 暂无任务记录，请先提交任务")
+        st.info("ℹ️ 没有可下载的视频任务")
 
 # 结果展示选项卡
 with tab3:
     st.header("生成结果查看")
 
+    finished_jobs = [job for job in get_batch_runner().jobs() if job.status == 'Finished']
+    if finished_jobs and st.session_state.get('results_batch_id') != finished_jobs[0].id:
+        # 有新的后台批次运行完成时显示其结果
+        st.session_state.results = finished_jobs[0].results
+        st.session_state.results_batch_id = finished_jobs[0].id
+
     if st.session_state.results:
         # 生成结果表格
         result_data = []
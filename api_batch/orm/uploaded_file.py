@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from datetime import datetime
+
+from orm.base import Base
+
+
+class UploadedFile(Base):
+    __tablename__ = 'uploaded_files'
+
+    id = Column(Integer, primary_key=True)
+    content_hash = Column(String, unique=True, index=True)  # 上传内容的sha256
+    file_id = Column(String)
+    filename = Column(String)
+    bytes = Column(Integer)
+    purpose = Column(String)
+    created_at = Column(DateTime, default=datetime.now)
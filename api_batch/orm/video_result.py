@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from datetime import datetime
+
+from orm.base import Base
+
+
+class VideoResult(Base):
+    __tablename__ = 'video_results'
+
+    id = Column(Integer, primary_key=True)
+    fingerprint = Column(String, unique=True, index=True)  # 任务内容指纹
+    task_id = Column(String)  # 生成该视频的任务
+    output_file = Column(String)
+    checksum = Column(String)  # 视频文件的sha256
+    bytes = Column(Integer)
+    created_at = Column(DateTime, default=datetime.now)
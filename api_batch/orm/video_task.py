@@ -2,23 +2,38 @@ from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, Foreign
 
 from orm.base import Base
 
+# 任务生命周期状态，各处判断任务是否结束都使用这里的定义
+# 失败：提交失败(Failed/Error)或接口返回生成失败(Fail，记录时转为Failed)
+FAILED_STATUSES = ('Failed', 'Fail', 'Error')
+# 已生成：Success 为接口侧已生成、尚未下载，Completed 为已下载或复用了结果缓存
+COMPLETED_STATUSES = ('Success', 'Completed')
+# 批量处理已结束、不再轮询或下载的状态
+TERMINAL_STATUSES = ('Completed',) + FAILED_STATUSES
+# 接口侧已结束、不需要再查询状态的状态
+SETTLED_STATUSES = COMPLETED_STATUSES + FAILED_STATUSES
+
 
 class VideoTask(Base):
     __tablename__ = 'video_tasks'
 
     id = Column(Integer, primary_key=True)
-    task_id = Column(String)
-    model = Column(String)
+    task_id = Column(String, index=True)
+    model = Column(String, index=True)
     prompt = Column(Text)
     first_frame_image = Column(String)
     prompt_optimizer = Column(Boolean)
     subject_reference = Column(Text)  # JSON list
-    status = Column(String)
+    status = Column(String, index=True)
     video_url = Column(String)  # 下载链接
     error = Column(Text)
     output_file = Column(String)
-    submit_time = Column(DateTime)
+    submit_time = Column(DateTime, index=True)
     complete_time = Column(DateTime)
+    api_key_id = Column(String)  # 提交任务所用密钥的ID(不保存密钥本身)，查询和下载使用同一密钥
+    fingerprint = Column(String, unique=True, index=True)  # 任务内容指纹，用于避免重复提交；失败的任务置空
+    claimed_by = Column(String, index=True)  # worker模式下持有该任务的worker
+    lease_expires = Column(DateTime)  # 租约到期时间，worker停止续约后其他worker可以接手
+    batch_id = Column(String, index=True)  # 所属批次(界面后台运行的批次)，用于按批次统计进度
 
 
 
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from datetime import datetime
+
+from orm.base import Base
+
+
+class VideoTaskEvent(Base):
+    """任务生命周期事件，只追加不修改"""
+    __tablename__ = 'video_task_events'
+
+    id = Column(Integer, primary_key=True)
+    task_id = Column(String, index=True)
+    # Submitted / 接口返回的状态(Queueing、Preparing、Processing、Success、Fail) /
+    # DownloadStarted / DownloadFinished / DownloadFailed
+    event = Column(String)
+    bytes = Column(Integer)
+    error_code = Column(String)
+    created_at = Column(DateTime, default=datetime.now, index=True)
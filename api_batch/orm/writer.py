@@ -0,0 +1,160 @@
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from orm.base import SessionLocal
+from orm.video_task import VideoTask
+from orm.video_task_event import VideoTaskEvent
+
+__all__ = ['TaskStateWriter']
+
+logger = logging.getLogger('hailuo.writer')
+
+
+class TaskStateWriter:
+    """
+    任务状态的单写入者
+
+    提交、轮询、下载等并发阶段不直接操作数据库会话，而是把插入和状态变化投递到队列，
+    由唯一的写线程批量取出：同一任务的多次更新合并为一次，相同字段组合的更新合并为一条
+    executemany 的 UPDATE，每批在一个事务中提交。生命周期事件随同一批次追加写入。
+    """
+
+    _table = VideoTask.__table__
+    _event_table = VideoTaskEvent.__table__
+
+    def __init__(self, batch_size=500, max_delay=0.2):
+        """batch_size: 每批最多处理的消息数；max_delay: 攒批的最长等待时间(秒)"""
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def insert(self, values):
+        """插入一条任务记录，values 为 VideoTask 的字段字典"""
+        self._queue.put(('insert', values))
+
+    def update(self, task_id, **fields):
+        """按task_id更新任务记录"""
+        self._queue.put(('update', (task_id, fields)))
+
+    def update_many(self, updates):
+        """批量更新，updates 为 [(task_id, {字段: 值}), ...]"""
+        for task_id, fields in updates:
+            self._queue.put(('update', (task_id, fields)))
+
+    def event(self, task_id, event, **fields):
+        """追加一条任务生命周期事件，fields 可包含 bytes、error_code"""
+        # 多行INSERT按第一行的字段绑定参数，每条事件都补齐可选字段，避免后面事件的字段被丢弃
+        values = {'bytes': None, 'error_code': None}
+        values.update(fields, task_id=task_id, event=event, created_at=datetime.now())
+        self._queue.put(('event', values))
+
+    def flush(self, timeout=None):
+        """等待此前投递的所有写入提交完成"""
+        done = threading.Event()
+        self._queue.put(('flush', done))
+        return done.wait(timeout)
+
+    def close(self):
+        """写完队列中剩余的消息后停止写线程"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(('stop', None))
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.batch_size and batch[-1][0] not in ('flush', 'stop'):
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            self._write(batch)
+
+            for kind, payload in batch:
+                if kind == 'flush':
+                    payload.set()
+            if batch[-1][0] == 'stop':
+                return
+
+    def _write(self, batch):
+        inserts = []
+        updates = {}
+        events = []
+        for kind, payload in batch:
+            if kind == 'insert':
+                inserts.append(payload)
+            elif kind == 'event':
+                events.append(payload)
+            elif kind == 'update':
+                task_id, fields = payload
+                updates.setdefault(task_id, {}).update(fields)
+        if not inserts and not updates and not events:
+            return
+
+        # 按字段组合分组，每组一条 executemany 的 UPDATE
+        groups = {}
+        for task_id, fields in updates.items():
+            groups.setdefault(tuple(sorted(fields)), []).append(dict(fields, b_task_id=task_id))
+
+        db = SessionLocal()
+        try:
+            if inserts:
+                db.execute(insert(self._table), inserts)
+            for keys, params in groups.items():
+                db.execute(self._update_statement(keys), params)
+            if events:
+                db.execute(insert(self._event_table), events)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning("批量写入任务状态出错，改为逐条写入: %s", e)
+            self._write_one_by_one(db, inserts, groups, events)
+        finally:
+            db.close()
+
+    def _update_statement(self, keys):
+        return (update(self._table)
+                .where(self._table.c.task_id == bindparam('b_task_id'))
+                .values({key: bindparam(key) for key in keys}))
+
+    def _write_one_by_one(self, db, inserts, groups, events):
+        """批量写入失败(如唯一约束冲突)时逐条写入，避免一条坏数据拖累整批"""
+        for values in inserts:
+            error = self._execute_one(db, insert(self._table), values)
+            if isinstance(error, IntegrityError) and values.get('fingerprint'):
+                # 指纹已被其他生成器(如界面与命令行同时运行)的相同任务占用；任务已提交，记录不能丢弃，去掉指纹后写入
+                logger.warning("任务 %s 的指纹已被其他记录占用，不带指纹写入", values.get('task_id'))
+                error = self._execute_one(db, insert(self._table), dict(values, fingerprint=None))
+            if error is not None:
+                logger.error("写入任务状态出错: %s, 数据: %s", error, values)
+
+        statements = [(self._update_statement(keys), params) for keys, group in groups.items() for params in group]
+        statements += [(insert(self._event_table), values) for values in events]
+        for statement, params in statements:
+            error = self._execute_one(db, statement, params)
+            if error is not None:
+                logger.error("写入任务状态出错: %s, 数据: %s", error, params)
+
+    @staticmethod
+    def _execute_one(db, statement, params):
+        """单独执行并提交一条语句，出错时回滚并返回异常"""
+        try:
+            db.execute(statement, params)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            return e
+        return None
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# 测试使用独立的临时SQLite数据库，须在导入 orm 之前设置
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='hailuo-test-'), 'test.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,23 @@
+from bench.mock_server import MockMiniMaxServer
+from hailuo import MiniMaxVideoBatchGenerator
+from orm.base import session_scope
+from orm.video_task import VideoTask
+
+
+def test_process_batch_leaves_queued_task_to_worker(tmp_path):
+    server = MockMiniMaxServer(download_size=100).start()
+    generator = MiniMaxVideoBatchGenerator('test-key', base_url=server.base_url, preflight=False)
+    task = {'model': 'T2V-01', 'prompt': 'queued then submitted directly'}
+    try:
+        assert generator.enqueue([task]) == 1
+        info = generator.process_batch([task], output_dir=str(tmp_path))
+    finally:
+        generator.close()
+        server.close()
+
+    assert [item['status'] for item in info] == ['Duplicate']
+    assert server.calls['submit'] == 0
+    with session_scope() as db:
+        rows = db.query(VideoTask).filter(VideoTask.prompt == task['prompt']).all()
+        # 排队记录保留指纹，worker认领后仍可命中结果缓存
+        assert [(row.status, bool(row.fingerprint)) for row in rows] == [('Queued', True)]
@@ -0,0 +1,69 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.file_uploader import ReferenceImageUploader
+from core.image_cache import EncodedImageCache, file_content_hash
+from orm.base import init_db, session_scope
+from orm.uploaded_file import UploadedFile
+
+
+class FilesApi:
+    """只实现文件接口的生成器替身，expired 中的文件查询时返回文件不存在"""
+
+    def __init__(self):
+        self.image_cache = EncodedImageCache()
+        self.preflight = None
+        self.expired = set()
+        self.uploads = 0
+
+    def upload_file(self, data, file_name, mime, purpose):
+        self.uploads += 1
+        return {'file': {'file_id': f"file-{self.uploads}"}, 'base_resp': {'status_code': 0}}
+
+    def retrieve_file(self, file_id):
+        if file_id in self.expired:
+            return {'base_resp': {'status_code': 1004, 'status_msg': 'file not found'}}
+        return {'file': {'file_id': file_id, 'download_url': f"https://files/{file_id}"},
+                'base_resp': {'status_code': 0}}
+
+
+def test_expired_file_id_is_uploaded_again(tmp_path):
+    init_db()
+    image = tmp_path / 'ref.jpg'
+    image.write_bytes(b'expired reference image')
+    api = FilesApi()
+    assert ReferenceImageUploader(api).reference(str(image)) == 'https://files/file-1'
+
+    # 新进程：内存缓存为空，数据库中的 file_id 已在服务端过期
+    api.image_cache.clear()
+    api.expired.add('file-1')
+    uploader = ReferenceImageUploader(api)
+    assert uploader.reference(str(image)) == 'https://files/file-2'
+    assert uploader.reference(str(image)) == 'https://files/file-2'
+    assert api.uploads == 2
+    with session_scope() as db:
+        content_hash = file_content_hash(image.read_bytes())
+        assert [row.file_id for row in db.query(UploadedFile).filter(UploadedFile.content_hash == content_hash)] \
+            == ['file-2']
+
+
+def test_concurrent_references_upload_and_retrieve_once(tmp_path):
+    init_db()
+    image = tmp_path / 'shared.jpg'
+    image.write_bytes(b'reference image shared by a whole batch')
+    api = FilesApi()
+    retrieved = []
+    retrieve_file = api.retrieve_file
+
+    def slow_retrieve(file_id):
+        time.sleep(0.05)
+        retrieved.append(file_id)
+        return retrieve_file(file_id)
+
+    api.retrieve_file = slow_retrieve
+    uploader = ReferenceImageUploader(api)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        urls = list(executor.map(lambda _: uploader.reference(str(image)), range(8)))
+
+    assert set(urls) == {'https://files/file-1'}
+    assert (api.uploads, len(retrieved), uploader.uploaded, uploader.reused) == (1, 1, 1, 0)
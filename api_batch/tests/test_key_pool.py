@@ -0,0 +1,29 @@
+import time
+
+import pytest
+
+from core.key_pool import KeyPool, NoAvailableKeyError
+
+BALANCE = {'task_id': '', 'base_resp': {'status_code': 1008, 'status_msg': 'insufficient balance'}}
+RATE_LIMITED = {'task_id': '', 'base_resp': {'status_code': 1002, 'status_msg': 'rate limit'}}
+
+
+def test_all_keys_out_of_balance_fails_fast():
+    pool = KeyPool(['key-aaaaaaaa', 'key-bbbbbbbb'])
+    for _ in range(2):
+        assert pool.observe(pool.choose(), BALANCE)
+
+    started = time.monotonic()
+    with pytest.raises(NoAvailableKeyError):
+        pool.choose()
+    assert time.monotonic() - started < 1
+
+
+def test_waits_for_rate_limited_key():
+    pool = KeyPool(['key-aaaaaaaa', 'key-bbbbbbbb'], cooldown=0.3)
+    first = pool.choose()
+    assert pool.observe(first, BALANCE)
+    second = pool.choose()
+    assert pool.observe(second, RATE_LIMITED)
+
+    assert pool.choose() is second
@@ -0,0 +1,19 @@
+from datetime import datetime, timedelta
+
+from core.poll_scheduler import learn_expected_times
+from orm.base import init_db, session_scope
+from orm.video_task import VideoTask
+
+
+def test_cached_results_are_not_learned_as_generation_time():
+    init_db()
+    now = datetime.now()
+    with session_scope() as db:
+        db.add(VideoTask(task_id='learn-1', model='learn-model', status='Completed',
+                         submit_time=now - timedelta(seconds=120), complete_time=now))
+        # 复用结果缓存的记录：没有task_id，提交即完成
+        db.add(VideoTask(task_id=None, model='learn-model', status='Completed', submit_time=now, complete_time=now))
+        db.add(VideoTask(task_id=None, model='learn-model', status='Completed', submit_time=now, complete_time=now))
+
+    with session_scope() as db:
+        assert learn_expected_times(db)['learn-model'] == 120
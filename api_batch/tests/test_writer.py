@@ -0,0 +1,38 @@
+from orm.base import init_db, session_scope
+from orm.video_task import VideoTask
+from orm.video_task_event import VideoTaskEvent
+from orm.writer import TaskStateWriter
+
+
+def test_mixed_events_in_one_batch_keep_optional_fields():
+    init_db()
+    writer = TaskStateWriter(max_delay=1)
+    writer.event('t1', 'Submitted')
+    writer.event('t1', 'DownloadFinished', bytes=1024)
+    writer.event('t2', 'Fail', error_code='1026')
+    writer.event('t3', 'DownloadFinished', bytes=2048)
+    writer.close()
+
+    with session_scope() as db:
+        rows = {(row.task_id, row.event): (row.bytes, row.error_code) for row in db.query(VideoTaskEvent)}
+    assert rows == {
+        ('t1', 'Submitted'): (None, None),
+        ('t1', 'DownloadFinished'): (1024, None),
+        ('t2', 'Fail'): (None, '1026'),
+        ('t3', 'DownloadFinished'): (2048, None),
+    }
+
+
+def test_insert_with_taken_fingerprint_keeps_the_task():
+    init_db()
+    writer = TaskStateWriter(max_delay=1)
+    writer.insert({'task_id': 'fp-1', 'status': 'Submitted', 'fingerprint': 'fp-shared'})
+    writer.flush()
+    # 另一个生成器同时提交了相同任务：指纹冲突，但任务已提交，记录必须写入
+    writer.insert({'task_id': 'fp-2', 'status': 'Submitted', 'fingerprint': 'fp-shared'})
+    writer.insert({'task_id': 'fp-3', 'status': 'Submitted', 'fingerprint': None})
+    writer.close()
+
+    with session_scope() as db:
+        rows = {row.task_id: row.fingerprint for row in db.query(VideoTask).filter(VideoTask.task_id.like('fp-%'))}
+    assert rows == {'fp-1': 'fp-shared', 'fp-2': None, 'fp-3': None}
@@ -2,6 +2,8 @@ __all__ = [
     "init_browser",
     "close_browser",
     "parse_cookie_string",
-
+    "setup_logger",
+    "redact",
 ]
-from .browser_utils import init_browser, close_browser, parse_cookie_string
\ No newline at end of file
+from .browser_utils import init_browser, close_browser, parse_cookie_string
+from .log_utils import setup_logger, redact
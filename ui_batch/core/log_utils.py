@@ -0,0 +1,51 @@
+import os
+import re
+import sys
+
+from loguru import logger
+
+__all__ = ['setup_logger', 'redact']
+
+# 日志中的敏感信息脱敏：Bearer令牌、JWT、cookie/token等字段的值
+_PATTERNS = (
+    (re.compile(r'(Bearer\s+)[A-Za-z0-9._~+/=-]+'), r'\1***'),
+    (re.compile(r'eyJ[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+'), '***'),
+    (re.compile(r'''(['"]?(?:cookie|cookie_string|token|authorization|password)['"]?\s*[:=]\s*['"]?)'''
+                r'''(?!Bearer\s)[^'",\s}]+''', re.IGNORECASE), r'\1***'),
+)
+
+
+def redact(text):
+    """把文本中的令牌、cookie等敏感信息替换为 ***"""
+    for pattern, replacement in _PATTERNS:
+        text = pattern.sub(replacement, text)
+    cookie_str = os.getenv('COOKIE_STRING')
+    if cookie_str and cookie_str in text:
+        text = text.replace(cookie_str, '***')
+    return text
+
+
+def _patch(record):
+    record['message'] = redact(record['message'])
+
+
+def setup_logger(level=None, serialize=None, log_file=None):
+    """
+    配置loguru的输出，返回配置好的logger(作为 logging 参数传给各个函数)
+
+    - enqueue=True：日志先进入队列，由后台线程写出，页面自动化流程不会被输出阻塞
+    - level: 日志级别，默认读取环境变量 LOG_LEVEL，再退回 INFO
+    - serialize: 控制台是否输出JSON行，默认读取环境变量 LOG_FORMAT=json
+    - log_file: 另外以JSON行格式写入该文件，默认读取环境变量 LOG_FILE
+    """
+    level = (level or os.getenv('LOG_LEVEL') or 'INFO').upper()
+    if serialize is None:
+        serialize = os.getenv('LOG_FORMAT', '').lower() == 'json'
+    log_file = log_file or os.getenv('LOG_FILE')
+
+    logger.remove()
+    logger.configure(patcher=_patch)
+    logger.add(sys.stderr, level=level, enqueue=True, serialize=serialize)
+    if log_file:
+        logger.add(log_file, level=level, enqueue=True, serialize=True, encoding='utf-8')
+    return logger
@@ -5,8 +5,7 @@ from pathlib import Path
 
 import pandas as pd
 
-from core import init_browser, close_browser
-from loguru import logger
+from core import init_browser, close_browser, setup_logger
 
 from core.create_video import create_video_by_image, batch_download_video
 
@@ -91,7 +90,8 @@ def main():
     """
     主程序入口函数
     """
-    print("=== Hailuo AI 自动化工具 ===")
+    logger = setup_logger()
+    logger.info("=== Hailuo AI 自动化工具 ===")
 
     # # 参考图目录
     reference_image_dir = "record/hailuo-img"